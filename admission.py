@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+"""
+admission.py -- Udacity conference server-side Python App Engine queued
+    admission of registrations
+
+When a popular conference opens, thousands of users register at once, and
+their transactions collide on the seat shards. Conferences with
+queuedAdmission set take registrations into a pull queue instead: a request
+only writes an AdmissionTicket (child of the user Profile, so requests don't
+contend with each other) and a pull task, in one transaction. A worker leases
+the tasks of the conference in batches of BATCH_SIZE and admits each batch in
+a single cross group transaction, taking the seats from a few shards. Users
+poll the status of their ticket.
+
+Only one worker runs per conference at a time (it holds a lock in memcache),
+so batches don't contend with each other on the shards. A worker runs at
+most BATCHES_PER_RUN batches, then schedules the next run.
+
+"""
+
+import logging
+import time
+
+from google.appengine.api import datastore_errors
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import AdmissionTicket
+from models import Registration
+import announcements
+import formcache
+import perf
+import seats
+import unitofwork
+
+QUEUE_NAME = 'registrations'
+# registrations admitted by each transaction. Each one is in the entity group
+# of it's profile, and cross group transactions span 25 groups at most, which
+# leaves the rest for the seat shards.
+BATCH_SIZE = 20
+MAX_SHARDS_PER_BATCH = 25 - BATCH_SIZE
+# seconds the worker holds the tasks of a batch
+LEASE_SECONDS = 60
+# seconds between the runs of the worker of a conference
+ADMISSION_INTERVAL = 1
+# batches admitted by a run of the worker, before it schedules the next one
+BATCHES_PER_RUN = 50
+# held by the running worker of the conference (websafe key); expires in case
+# the worker dies
+MEMCACHE_WORKER_KEY = 'ADMISSION_WORKER:%s'
+WORKER_LOCK_SECONDS = 10 * 60
+
+# ticket statuses
+QUEUED = 'QUEUED'
+REGISTERED = 'REGISTERED'
+SOLD_OUT = 'SOLD_OUT'
+CANCELLED = 'CANCELLED'
+NOT_REGISTERED = 'NOT_REGISTERED'
+
+
+def _ticketKey(p_key, conf_key):
+    return ndb.Key(AdmissionTicket, conf_key.urlsafe(), parent=p_key)
+
+
+def _registrationKey(p_key, conf_key):
+    return ndb.Key(Registration, conf_key.urlsafe(), parent=p_key)
+
+
+def status(p_key, conf_key):
+    """Return the status of the registration of the profile"""
+    ticket, registration = ndb.get_multi([
+        _ticketKey(p_key, conf_key), _registrationKey(p_key, conf_key)])
+    if registration:
+        return REGISTERED
+    if ticket and ticket.status in (QUEUED, SOLD_OUT):
+        return ticket.status
+    return NOT_REGISTERED
+
+
+@unitofwork.transactional()
+def _enqueue(p_key, conf_key):
+    ticket, registration = ndb.get_multi([
+        _ticketKey(p_key, conf_key), _registrationKey(p_key, conf_key)])
+    if registration:
+        return REGISTERED
+    if ticket and ticket.status == QUEUED:
+        return QUEUED
+    unitofwork.add(AdmissionTicket(key=_ticketKey(p_key, conf_key),
+        status=QUEUED))
+    taskqueue.Queue(QUEUE_NAME).add(taskqueue.Task(
+        payload=p_key.urlsafe(), method='PULL', tag=conf_key.urlsafe()),
+        transactional=True)
+    return QUEUED
+
+
+def enqueue(p_key, conf_key):
+    """
+    Queue the registration of the profile in the conference, unless it's
+    already registered or queued, and make sure the worker runs. Returns the
+    status of the registration.
+    """
+    result = _enqueue(p_key, conf_key)
+    if result == QUEUED:
+        scheduleAdmission(conf_key)
+    return result
+
+
+@unitofwork.transactional()
+def cancel(p_key, conf_key):
+    """Cancel the queued registration of the profile, if any"""
+    ticket = _ticketKey(p_key, conf_key).get()
+    if not ticket or ticket.status != QUEUED:
+        return False
+    ticket.status = CANCELLED
+    unitofwork.add(ticket)
+    return True
+
+
+def scheduleAdmission(conf_key):
+    """
+    Schedule the worker of the conference. Tasks are named after the
+    conference and the current ADMISSION_INTERVAL, and run once it's over, so
+    there is at most one of them per interval and it sees every registration
+    queued during the interval.
+    """
+    now = time.time()
+    bucket = int(now) // ADMISSION_INTERVAL
+    try:
+        taskqueue.add(
+                name='admit-%s-%d' % (conf_key.urlsafe(), bucket),
+                params={'websafeConferenceKey': conf_key.urlsafe()},
+                url='/tasks/admit_registrations',
+                countdown=max(0, (bucket + 1) * ADMISSION_INTERVAL - now))
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        # the worker for this interval is already scheduled
+        pass
+
+
+@unitofwork.transactional(xg=True)
+@perf.counted('admission.attempts')
+def _admitBatch(conf_key, p_keys, shard_keys, sold_out):
+    """
+    Admit the profiles, in order, taking their seats from the given shards.
+    Profiles already registered or whose ticket isn't queued anymore are
+    skipped. Once the shards are empty, the rest are told the conference is
+    sold out if it is (sold_out), or else left queued. Returns the number of
+    seats taken and the profiles handled.
+    """
+    shards = [shard for shard in ndb.get_multi(shard_keys) if shard]
+    entities = ndb.get_multi(
+            [_ticketKey(p_key, conf_key) for p_key in p_keys] +\
+            [_registrationKey(p_key, conf_key) for p_key in p_keys])
+    tickets, registrations = entities[:len(p_keys)], entities[len(p_keys):]
+    taken = 0
+    handled = []
+    for p_key, ticket, registration in zip(p_keys, tickets, registrations):
+        if registration or not ticket or ticket.status != QUEUED:
+            handled.append(p_key)
+            continue
+        shard = next((shard for shard in shards if shard.seats > 0), None)
+        if shard:
+            shard.seats -= 1
+            taken += 1
+            unitofwork.add(shard, Registration(
+                key=_registrationKey(p_key, conf_key), conference=conf_key))
+            ticket.status = REGISTERED
+        elif sold_out:
+            ticket.status = SOLD_OUT
+        else:
+            # the shards of this batch are empty, but not all of them
+            continue
+        unitofwork.add(ticket)
+        handled.append(p_key)
+    return (taken, handled)
+
+
+def admitAll(websafeConferenceKey):
+    """
+    Admit the queued registrations of the conference, a batch at a time,
+    until the queue is empty or BATCHES_PER_RUN batches are done (then the
+    next run is scheduled). Returns the number of queued registrations
+    handled, or None if another worker of the conference is running.
+    """
+    lock_key = MEMCACHE_WORKER_KEY % websafeConferenceKey
+    if not memcache.add(lock_key, 1, time=WORKER_LOCK_SECONDS):
+        return None
+    conf_key = ndb.Key(urlsafe=websafeConferenceKey)
+    try:
+        handled, more = _admitBatches(conf_key, conf_key.get())
+    finally:
+        memcache.delete(lock_key)
+    if more:
+        scheduleAdmission(conf_key)
+    return handled
+
+
+def _admitBatches(conf_key, conf):
+    """
+    Admit up to BATCHES_PER_RUN batches. Returns the number of registrations
+    handled and whether there may be more.
+    """
+    websafeConferenceKey = conf_key.urlsafe()
+    queue = taskqueue.Queue(QUEUE_NAME)
+    total = 0
+    for _ in range(BATCHES_PER_RUN):
+        tasks = queue.lease_tasks_by_tag(LEASE_SECONDS, BATCH_SIZE,
+                tag=websafeConferenceKey)
+        if not tasks:
+            return (total, False)
+        if not conf:
+            queue.delete_tasks(tasks)
+            total += len(tasks)
+            continue
+        perf.count('admission.batches')
+        # the emptiest shards are left for the next batches
+        shards = sorted([shard for shard in seats.getShards(conf)\
+                if shard and shard.seats > 0],
+                key=lambda shard: -shard.seats)
+        p_keys = []
+        for task in tasks:
+            p_key = ndb.Key(urlsafe=task.payload)
+            if p_key not in p_keys:
+                p_keys.append(p_key)
+        try:
+            taken, handled = _admitBatch(conf_key, p_keys,
+                    [shard.key for shard in shards[:MAX_SHARDS_PER_BATCH]],
+                    not shards)
+        except datastore_errors.TransactionFailedError:
+            # collided with direct writes to the shards (e.g. an organizer
+            # update); the tasks are released and leased again
+            logging.warning('Could not admit a batch of %s', conf_key)
+            perf.count('admission.failed')
+            taken, handled = 0, []
+        done = [task for task in tasks\
+                if ndb.Key(urlsafe=task.payload) in handled]
+        queue.delete_tasks(done)
+        total += len(done)
+        # the others are leased again right away
+        for task in tasks:
+            if ndb.Key(urlsafe=task.payload) not in handled:
+                queue.modify_task_lease(task, 0)
+        if taken:
+            seats_left = seats.seatsChanged(conf_key, -taken)
+            if seats_left is None:
+                seats_left = seats.seatsAvailableAsync(conf).get_result()
+            announcements.seatsChanged(conf_key, conf.name, seats_left)
+            formcache.invalidate([websafeConferenceKey])
+    return (total, True)
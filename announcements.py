@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+"""
+announcements.py -- Udacity conference server-side Python App Engine set of
+    the nearly sold out conferences
+
+The conferences with a few seats left (NEARLY_SOLD_OUT_SEATS at most, but not
+sold out) are kept in a set, updated whenever the seats available in a
+conference change, instead of being searched for by a cron job. The set is
+kept in memcache as a dict of conference websafe key -> name, backed by
+NearlySoldOut entities (children of a single root, so rebuilding the set
+from them is strongly consistent). The announcement is rendered from it.
+
+"""
+
+import logging
+
+from google.appengine.api import datastore_errors
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import NearlySoldOut
+
+NEARLY_SOLD_OUT_SEATS = 5
+MEMCACHE_NEARLY_SOLD_OUT_KEY = 'NEARLY_SOLD_OUT'
+# the set is rebuilt from the datastore at least this often (seconds), in
+# case memcache missed an update
+NEARLY_SOLD_OUT_CACHE_TIME = 3600
+# attempts at updating the set in memcache before giving up and dropping it
+CAS_RETRIES = 5
+ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
+                    'are nearly sold out: %s')
+
+ROOT_KEY = ndb.Key('NearlySoldOutRoot', 'root')
+
+
+def isNearlySoldOut(seats_left):
+    """Return whether a conference with these seats left is nearly sold out"""
+    return seats_left is not None and 0 < seats_left <= NEARLY_SOLD_OUT_SEATS
+
+
+def _load():
+    """Rebuild the set from the datastore and cache it"""
+    conferences = dict((entity.key.id(), entity.name)\
+            for entity in NearlySoldOut.query(ancestor=ROOT_KEY))
+    memcache.add(MEMCACHE_NEARLY_SOLD_OUT_KEY, conferences,
+            time=NEARLY_SOLD_OUT_CACHE_TIME)
+    return conferences
+
+
+def nearlySoldOut():
+    """Return the nearly sold out conferences, as websafe key -> name"""
+    conferences = memcache.get(MEMCACHE_NEARLY_SOLD_OUT_KEY)
+    if conferences is None:
+        conferences = _load()
+    return conferences
+
+
+def _updateCache(websafeConferenceKey, name):
+    """
+    Add the conference to the cached set (or remove it if name is None),
+    compare-and-set so concurrent updates aren't lost. If the set isn't
+    cached, it's left to be rebuilt from the datastore.
+    """
+    client = memcache.Client()
+    for _ in range(CAS_RETRIES):
+        conferences = client.gets(MEMCACHE_NEARLY_SOLD_OUT_KEY)
+        if conferences is None:
+            return
+        if name is None:
+            conferences.pop(websafeConferenceKey, None)
+        else:
+            conferences[websafeConferenceKey] = name
+        if client.cas(MEMCACHE_NEARLY_SOLD_OUT_KEY, conferences,
+                time=NEARLY_SOLD_OUT_CACHE_TIME):
+            return
+    logging.warning('Could not update the nearly sold out conferences, '
+            'dropping them from memcache')
+    memcache.delete(MEMCACHE_NEARLY_SOLD_OUT_KEY)
+
+
+def _updateEntry(conf_key, name, seats_left):
+    """
+    Add or remove the NearlySoldOut entity of the conference, per it's seats
+    left, unless it's already right. Returns the name of the conference if
+    it's nearly sold out, else None.
+    """
+    entry_key = ndb.Key(NearlySoldOut, conf_key.urlsafe(), parent=ROOT_KEY)
+    entry = entry_key.get()
+    if isNearlySoldOut(seats_left):
+        if not entry or entry.name != name:
+            NearlySoldOut(key=entry_key, name=name).put()
+        return name
+    if entry:
+        entry_key.delete()
+    return None
+
+
+@ndb.non_transactional
+def seatsChanged(conf_key, name, seats_left, check=False):
+    """
+    Add the conference to the set when it's seats left cross below
+    NEARLY_SOLD_OUT_SEATS, or remove it when it's sold out or has seats again.
+    Only writes when the conference moves in or out of the cached set (or
+    it's name changes), unless check is set.
+
+    Registrations committing at once may apply their changes out of order;
+    the seats sync task (see seats.syncConference), which runs after them,
+    checks the set against the total of the shards. Failing to update the
+    set never fails the request: it's left to that task, or to reconcile.
+    """
+    wsck = conf_key.urlsafe()
+    conferences = nearlySoldOut()
+    if not check:
+        if isNearlySoldOut(seats_left):
+            if conferences.get(wsck) == name:
+                return
+        elif wsck not in conferences:
+            return
+    try:
+        current = _updateEntry(conf_key, name, seats_left)
+    except datastore_errors.Error:
+        logging.warning('Could not update the nearly sold out conferences '
+                'with %s', wsck, exc_info=True)
+        return
+    if conferences.get(wsck) != current:
+        _updateCache(wsck, current)
+
+
+def reconcile():
+    """
+    Rebuild the set from the seats available stored in the conferences, in
+    case an update was missed. Returns the nearly sold out conferences.
+    """
+    confs = Conference.query(ndb.AND(
+        Conference.seatsAvailable <= NEARLY_SOLD_OUT_SEATS,
+        Conference.seatsAvailable > 0)
+    ).fetch(projection=[Conference.name])
+    conferences = dict((conf.key.urlsafe(), conf.name) for conf in confs)
+    stale = [key for key in NearlySoldOut.query(ancestor=ROOT_KEY).fetch(
+                keys_only=True) if key.id() not in conferences]
+    ndb.delete_multi(stale)
+    ndb.put_multi([
+        NearlySoldOut(key=ndb.Key(NearlySoldOut, wsck, parent=ROOT_KEY),
+            name=name)\
+        for wsck, name in conferences.items()])
+    memcache.set(MEMCACHE_NEARLY_SOLD_OUT_KEY, conferences,
+            time=NEARLY_SOLD_OUT_CACHE_TIME)
+    return conferences
+
+
+def announcement(conferences=None):
+    """Return the announcement of the nearly sold out conferences, if any"""
+    if conferences is None:
+        conferences = nearlySoldOut()
+    if not conferences:
+        return ""
+    return ANNOUNCEMENT_TPL % ', '.join(sorted(conferences.values()))
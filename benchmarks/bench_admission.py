@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+
+"""
+bench_admission.py -- load test of direct vs queued registration
+
+Creates a conference with S seats and U users (U > S makes it a flash crowd
+selling out), then registers every user from T threads at once, first in a
+conference registering directly (a transaction per registration, on the seat
+shards) and then in one with queued admission (see admission.py), whose
+queue is drained meanwhile by W concurrent workers (only one of which runs at
+a time). The testbed taskqueue stub stands in for the pull queue. Reports the
+throughput, the latency of accepting a registration, the transaction attempts
+and the failures of each mode, and checks that no seat is sold twice.
+
+With --shards, direct registration is run once per number of seat shards
+given (patching seats.NUM_SHARDS), showing how it's throughput and failed
+transactions scale with the shards.
+
+    python benchmarks/bench_admission.py [--seats S] [--users U]
+        [--threads T] [--workers W] [--shards N [N ...]]
+
+See harness.py for the requirements.
+
+"""
+
+import argparse
+import threading
+import time
+
+from harness import Harness
+from harness import percentile
+
+from google.appengine.ext import ndb
+
+import admission
+import perf
+import seats
+from conference import ConferenceApi
+from models import ConferenceForm
+from models import ConflictException
+from models import Profile
+from models import ProfileMiniForm
+from models import Registration
+from models import TeeShirtSize
+
+# attempts of a user registering directly, as a client retrying on conflict
+CLIENT_ATTEMPTS = 5
+
+
+def createConference(harness, api, capacity, queued):
+    """Create the conference. Returns it."""
+    harness.login('organizer@example.com')
+    harness.call('saveProfile', api.saveProfile,
+            ProfileMiniForm(displayName='Organizer',
+                teeShirtSize=TeeShirtSize.M_M))
+    form = harness.call('createConference', api.createConference,
+            ConferenceForm(
+                name='Flash crowd %s' % ('queued' if queued else 'direct'),
+                startDate='2016-06-01',
+                endDate='2016-06-03',
+                maxAttendees=capacity,
+                queuedAdmission=queued))
+    return ndb.Key(urlsafe=form.websafeKey).get()
+
+
+def createProfiles(users):
+    """
+    Create the profiles of the users. Endpoints reads the user from the
+    environment, which the threads share, so they register the profiles
+    directly.
+    """
+    p_keys = [ndb.Key(Profile, 'user%d@example.com' % i)\
+            for i in range(users)]
+    ndb.put_multi([Profile(key=p_key, displayName=p_key.id(),
+            mainEmail=p_key.id()) for p_key in p_keys])
+    return p_keys
+
+
+def hammer(p_keys, threads, register):
+    """
+    Call register with every profile, from the given number of threads.
+    Returns the latencies (ms) and the wall time (s).
+    """
+    latencies = []
+    lock = threading.Lock()
+    pending = list(p_keys)
+
+    def run():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                p_key = pending.pop()
+            start = time.time()
+            register(p_key)
+            elapsed = (time.time() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+
+    start = time.time()
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, time.time() - start
+
+
+def checkSeats(conf, capacity):
+    """Check that the seats taken match the registrations. Returns them."""
+    registered = Registration.query(Registration.conference == conf.key)\
+            .count()
+    left = sum(shard.seats for shard in seats.getShards(conf) if shard)
+    assert registered <= capacity, 'oversold: %d registrations' % registered
+    assert registered + left == capacity, (registered, left)
+    return registered
+
+
+def report(label, latencies, wall, registered, values):
+    print '%-10s %5d calls  %7.1f reg/s  accept p50 %7.2fms  p99 %7.2fms' % (
+            label, len(latencies), registered / wall if wall else 0,
+            percentile(latencies, 50), percentile(latencies, 99))
+    for name in sorted(values):
+        print '           %-32s %6d' % (name, values[name])
+
+
+def counters(method):
+    """Return the counters of the calls to the method so far"""
+    return perf.stats().get(method, {}).get('counters', {})
+
+
+def direct(harness, api, args, p_keys, label='direct'):
+    """Register every user in a conference without queued admission"""
+    conf = createConference(harness, api, args.seats, False)
+    before = counters('_registerProfile')
+    client = {}
+    lock = threading.Lock()
+
+    @perf.profiled
+    def _registerProfile(p_key):
+        return api._registerProfile(p_key, conf, True)
+
+    def register(p_key):
+        for attempt in range(CLIENT_ATTEMPTS):
+            try:
+                _registerProfile(p_key)
+                return
+            except ConflictException as e:
+                if 'no seats' in str(e):
+                    return
+                with lock:
+                    client['client.retries'] = \
+                        client.get('client.retries', 0) + 1
+        with lock:
+            client['client.gaveUp'] = client.get('client.gaveUp', 0) + 1
+
+    latencies, wall = hammer(p_keys, args.threads, register)
+    # only the counters of this run
+    client.update((name, n - before.get(name, 0))\
+            for name, n in counters('_registerProfile').items())
+    registered = checkSeats(conf, args.seats)
+    report(label, latencies, wall, registered, client)
+
+
+def queued(harness, api, args, p_keys):
+    """
+    Queue every user in a conference with queued admission, while W workers
+    try to admit them (as the worker tasks scheduled during the crowd would,
+    only one at a time getting the conference lock).
+    """
+    conf = createConference(harness, api, args.seats, True)
+    wsck = conf.key.urlsafe()
+    crowd_done = threading.Event()
+    busy = []
+    admitAll = perf.profiled(admission.admitAll)
+
+    def work():
+        while True:
+            handled = admitAll(wsck)
+            if handled is None:
+                busy.append(1)
+            elif handled == 0 and crowd_done.is_set():
+                return
+            time.sleep(0.01)
+
+    start = time.time()
+    workers = [threading.Thread(target=work) for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    latencies, _ = hammer(p_keys, args.threads,
+            lambda p_key: admission.enqueue(p_key, conf.key))
+    crowd_done.set()
+    for worker in workers:
+        worker.join()
+    wall = time.time() - start
+
+    admitted = dict(counters('admitAll'), **{'worker.busy': len(busy)})
+    registered = checkSeats(conf, args.seats)
+    # everyone is admitted until the conference sells out
+    assert registered == min(args.seats, len(p_keys)), registered
+    statuses = [admission.status(p_key, conf.key) for p_key in p_keys]
+    assert statuses.count(admission.QUEUED) == 0
+    assert statuses.count(admission.REGISTERED) == registered
+    report('queued', latencies, wall, registered, admitted)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--seats', type=int, default=200)
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=4,
+            help='concurrent admission workers')
+    parser.add_argument('--shards', type=int, nargs='+',
+            help='numbers of seat shards to run direct registration with')
+    args = parser.parse_args()
+
+    harness = Harness()
+    harness.setUp()
+    # every call goes into the histograms, which hold the counters
+    perf.SAMPLE_RATE = 1
+    try:
+        api = ConferenceApi()
+        p_keys = createProfiles(args.users)
+        # the shards of a conference are created along with it, so each run
+        # registers in a new conference
+        num_shards = seats.NUM_SHARDS
+        for n in args.shards or []:
+            seats.NUM_SHARDS = n
+            direct(harness, api, args, p_keys, label='direct/%d' % n)
+        seats.NUM_SHARDS = num_shards
+        direct(harness, api, args, p_keys)
+        queued(harness, api, args, p_keys)
+    finally:
+        harness.tearDown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+"""
+bench_api.py -- offline benchmark and load test of the Conference Central API
+
+Seeds the testbed with synthetic data through the API itself (N conferences,
+M sessions per conference, K speakers whose names collide in spelling), then
+drives the main read and write endpoints, reporting latency percentiles, RPCs
+per call and memory per endpoint. The write paths are checked for reads of
+the entities they have just written, and for making more than one put RPC
+(their writes are batched by a unit of work, see unitofwork.py).
+
+    python benchmarks/bench_api.py [--conferences N] [--sessions M]
+        [--speakers K] [--users U] [--save FILE] [--baseline FILE]
+
+Save a run with --save before a change and compare against it with
+--baseline after. See harness.py for the requirements.
+
+"""
+
+import argparse
+import random
+
+from harness import Harness
+from harness import loadReport
+from harness import printReport
+from harness import saveReport
+
+import conference
+from conference import ConferenceApi
+from main import app
+from models import ConferenceForm
+from models import ConferenceQueryForm
+from models import ConferenceQueryForms
+from models import ProfileMiniForm
+from models import SessionForm
+from models import SpeakerForm
+from models import Speaker
+from models import TeeShirtSize
+
+CITIES = ['London', 'Paris', 'Tokyo', 'Chicago', 'Berlin']
+TOPICS = ['Web', 'Cloud', 'Mobile', 'Data', 'Security']
+SESSION_TYPES = ['talk', 'workshop', 'keynote', 'lightning']
+FIRST_NAMES = ['Ada', 'Alan', 'Grace', 'Edsger', 'Barbara', 'Donald', 'Ken']
+LAST_NAMES = ['Lovelace', 'Turing', 'Hopper', 'Dijkstra', 'Liskov', 'Knuth']
+
+
+def request(container, **fields):
+    """Build the request message of a ResourceContainer"""
+    return container.combined_message_class(**fields)
+
+
+def speakerNames(k):
+    """
+    Return k speaker names. Names repeat with different spelling (case and
+    spacing), as organizers type them, so they collide on the speaker key.
+    """
+    names = []
+    for i in range(k):
+        name = '%s %s' % (FIRST_NAMES[i % len(FIRST_NAMES)],
+                LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)])
+        if i >= len(FIRST_NAMES) * len(LAST_NAMES):
+            name += ' %d' % (i // (len(FIRST_NAMES) * len(LAST_NAMES)))
+        names.append(name)
+    return names
+
+
+def misspell(name, rnd):
+    """Return the name spelled as another organizer could"""
+    return rnd.choice([name, name.lower(), name.upper(),
+        name.replace(' ', '  ')])
+
+
+def seed(harness, api, args, rnd):
+    """Create the conferences, sessions and speakers. Returns their keys."""
+    organizers = ['organizer%d@example.com' % i\
+            for i in range(max(1, args.conferences // 10))]
+    for email in organizers:
+        harness.login(email)
+        harness.call('saveProfile', api.saveProfile,
+                ProfileMiniForm(displayName=email.split('@')[0],
+                    teeShirtSize=TeeShirtSize.M_M),
+                maxPuts=1)
+
+    names = speakerNames(args.speakers)
+    conf_keys, session_keys = [], []
+    for i in range(args.conferences):
+        harness.login(organizers[i % len(organizers)])
+        month = rnd.randint(1, 12)
+        form = harness.call('createConference', api.createConference,
+                ConferenceForm(
+                    name='Conference %d' % i,
+                    description='Synthetic conference',
+                    city=rnd.choice(CITIES),
+                    topics=rnd.sample(TOPICS, 2),
+                    startDate='2016-%02d-01' % month,
+                    endDate='2016-%02d-03' % month,
+                    maxAttendees=args.users * 2),
+                checkWrites=True)
+        conf_keys.append(form.websafeKey)
+
+        sessions = [SessionForm(
+                name='Session %d.%d' % (i, j),
+                highlights=rnd.sample(TOPICS, 2),
+                speaker=SpeakerForm(name=misspell(rnd.choice(names), rnd)),
+                duration=rnd.choice([30, 45, 60, 90]),
+                typeOfSession=rnd.choice(SESSION_TYPES),
+                date='2016-%02d-0%d' % (month, rnd.randint(1, 3)),
+                startTime='%02d:%02d' % (rnd.randint(8, 20),
+                    rnd.choice([0, 30])))\
+            for j in range(args.sessions)]
+        # most of the agenda is imported at once, the rest one by one
+        single = sessions[:2]
+        forms = harness.call('createSessionsBulk', api.createSessionsBulk,
+                request(conference.SESSIONS_BULK_POST_REQUEST,
+                    websafeConferenceKey=form.websafeKey,
+                    items=sessions[2:]),
+                checkWrites=True)
+        session_keys.extend(s.websafeKey for s in forms.items)
+        for s in single:
+            s = harness.call('createSession', api.createSession,
+                request(conference.SESSION_POST_REQUEST,
+                    websafeConferenceKey=form.websafeKey,
+                    **dict((field.name, getattr(s, field.name))\
+                        for field in s.all_fields())),
+                checkWrites=True, maxPuts=1)
+            session_keys.append(s.websafeKey)
+
+    # featured speakers, seat syncs and emails
+    harness.runTasks(app)
+    return conf_keys, session_keys, names
+
+
+def drive(harness, api, args, rnd, conf_keys, session_keys, names):
+    """Call the read and write endpoints on random keys"""
+    for _ in range(args.calls):
+        harness.call('queryConferences', api.queryConferences,
+                ConferenceQueryForms())
+        harness.call('queryConferences(city)', api.queryConferences,
+                ConferenceQueryForms(filters=[ConferenceQueryForm(
+                    field='CITY', operator='EQ', value=rnd.choice(CITIES))]))
+        harness.call('getConference', api.getConference,
+                request(conference.CONF_GET_REQUEST,
+                    websafeConferenceKey=rnd.choice(conf_keys)))
+        harness.call('getConferenceSessions', api.getConferenceSessions,
+                request(conference.CONF_GET_PAGE_REQUEST,
+                    websafeConferenceKey=rnd.choice(conf_keys)))
+        harness.call('querySessions', api.querySessions,
+                ConferenceQueryForms(filters=[
+                    ConferenceQueryForm(field='TYPE', operator='EQ',
+                        value=rnd.choice(SESSION_TYPES)),
+                    ConferenceQueryForm(field='START_TIME', operator='LT',
+                        value='19:00'),
+                    ConferenceQueryForm(field='DURATION', operator='GTEQ',
+                        value='45')]))
+        harness.call('getSessionsBySpeaker', api.getSessionsBySpeaker,
+                request(conference.SPEAKER_GET_REQUEST,
+                    websafeSpeakerKey=Speaker.keyForName(
+                        rnd.choice(names)).urlsafe()))
+
+    # every user registers for a few conferences and wishes a few sessions.
+    # Their profiles are created first, as a new profile is written before
+    # the transactions of the request.
+    for i in range(args.users):
+        harness.login('user%d@example.com' % i)
+        harness.call('saveProfile', api.saveProfile,
+                ProfileMiniForm(displayName='user%d' % i,
+                    teeShirtSize=TeeShirtSize.M_M),
+                maxPuts=1)
+        for wsck in rnd.sample(conf_keys, min(3, len(conf_keys))):
+            harness.call('registerForConference', api.registerForConference,
+                    request(conference.CONF_REGISTER_REQUEST,
+                        websafeConferenceKey=wsck),
+                    checkWrites=True, maxPuts=1)
+        wished = rnd.sample(session_keys, min(3, len(session_keys)))
+        for wssk in wished:
+            harness.call('addSessionToWishlist', api.addSessionToWishlist,
+                    request(conference.ADD_SESSION_POST_REQUEST,
+                        websafeSessionKey=wssk, lightweight=True),
+                    checkWrites=True, maxPuts=1)
+        # and then changes their mind about one of them
+        harness.call('deleteSessionInWishlist', api.deleteSessionInWishlist,
+                request(conference.ADD_SESSION_POST_REQUEST,
+                    websafeSessionKey=wished[0], lightweight=True),
+                checkWrites=True, maxPuts=1, maxDeletes=1)
+    harness.runTasks(app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--conferences', type=int, default=20)
+    parser.add_argument('--sessions', type=int, default=30,
+            help='sessions per conference')
+    parser.add_argument('--speakers', type=int, default=60)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--calls', type=int, default=50,
+            help='calls to each read endpoint')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='save the report to this file')
+    parser.add_argument('--baseline', help='compare with this saved report')
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    harness = Harness()
+    harness.setUp()
+    try:
+        api = ConferenceApi()
+        keys = seed(harness, api, args, rnd)
+        drive(harness, api, args, rnd, *keys)
+    finally:
+        harness.tearDown()
+
+    report = harness.report()
+    printReport(report, loadReport(args.baseline) if args.baseline else None)
+    if args.save:
+        saveReport(report, args.save)
+
+
+if __name__ == '__main__':
+    main()
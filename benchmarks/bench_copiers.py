@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+"""
+bench_copiers.py -- micro-benchmark of the copy of entities to forms
+
+Compares the per-entity cost of the reflective loops formerly used by the
+_copy*ToForm methods with the precompiled copiers of copiers.py, and checks
+that both build the same forms. Needs the App Engine SDK and the endpoints
+library in the PYTHONPATH; run from the application directory:
+
+    python benchmarks/bench_copiers.py [number of entities]
+
+"""
+
+import os
+import sys
+import timeit
+from datetime import date
+from datetime import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('APPLICATION_ID', 'dev~conference-central')
+
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import ConferenceForm
+from models import Session
+from models import SessionForm
+from models import Speaker
+from models import SpeakerForm
+from copiers import CONFERENCE_COPIER
+from copiers import SESSION_COPIER
+from copiers import SPEAKER_COPIER
+
+
+def reflectiveConference(conf, displayName):
+    """The former _copyConferenceToForm"""
+    cf = ConferenceForm()
+    for field in cf.all_fields():
+        if hasattr(conf, field.name):
+            if field.name.endswith('Date'):
+                setattr(cf, field.name, str(getattr(conf, field.name)))
+            else:
+                setattr(cf, field.name, getattr(conf, field.name))
+        elif field.name == "websafeKey":
+            setattr(cf, field.name, conf.key.urlsafe())
+    if displayName:
+        setattr(cf, 'organizerDisplayName', displayName)
+    cf.check_initialized()
+    return cf
+
+
+def reflectiveSession(session, displayName):
+    """The former _copySessionToForm"""
+    sessionForm = SessionForm()
+    for field in sessionForm.all_fields():
+        if hasattr(session, field.name):
+            if field.name in ["date", "startTime"]:
+                setattr(sessionForm, field.name,
+                        str(getattr(session, field.name)))
+            else:
+                setattr(sessionForm, field.name,
+                        getattr(session, field.name))
+        elif field.name == "websafeKey":
+            setattr(sessionForm, field.name, session.key.urlsafe())
+    if displayName:
+        setattr(sessionForm, 'conferenceDisplayName', displayName)
+    sessionForm.check_initialized()
+    return sessionForm
+
+
+def reflectiveSpeaker(speaker):
+    """The former _copySpeakerToForm"""
+    spForm = SpeakerForm()
+    for field in spForm.all_fields():
+        if field.name == "sessions":
+            setattr(spForm, field.name,
+                    [session.urlsafe() for session in speaker.sessions])
+        elif hasattr(speaker, field.name):
+            setattr(spForm, field.name, getattr(speaker, field.name))
+        elif field.name == "websafeKey":
+            setattr(spForm, field.name, speaker.key.urlsafe())
+    spForm.check_initialized()
+    return spForm
+
+
+def makeEntities(n):
+    """Build n conferences, sessions and speakers, without storing them"""
+    p_key = ndb.Key('Profile', 'organizer')
+    confs, sessions, speakers = [], [], []
+    for i in range(n):
+        c_key = ndb.Key(Conference, i + 1, parent=p_key)
+        confs.append(Conference(key=c_key, name='Conference %d' % i,
+            description='A conference', organizerUserId='organizer',
+            topics=['Web', 'Cloud'], city='London',
+            startDate=date(2016, 5, 1), month=5, endDate=date(2016, 5, 3),
+            maxAttendees=100, seatsAvailable=50))
+        s_key = ndb.Key(Session, i + 1, parent=c_key)
+        sessions.append(Session(key=s_key, name='Session %d' % i,
+            highlights=['Intro'], speakerDisplayName='Speaker %d' % i,
+            duration=60, typeOfSession='talk', date=date(2016, 5, 1),
+            startTime=time(10, 0), conferenceId=i + 1))
+        speakers.append(Speaker(key=Speaker.keyForName('Speaker %d' % i),
+            name='Speaker %d' % i, specialties=['Python'], city='London',
+            country='UK', languages=['English'], sessions=[s_key]))
+    return confs, sessions, speakers
+
+
+def bench(label, func, entities, repeat=5):
+    """Print the best per-entity time of copying all the entities"""
+    timer = timeit.Timer(lambda: [func(e) for e in entities])
+    best = min(timer.repeat(repeat=repeat, number=1))
+    print '%-24s %8.2f us/entity' % (label, best / len(entities) * 1e6)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    confs, sessions, speakers = makeEntities(n)
+
+    pairs = [
+        ('conference', confs,
+            lambda c: reflectiveConference(c, 'Organizer'),
+            lambda c: CONFERENCE_COPIER.copy(c,
+                organizerDisplayName='Organizer')),
+        ('session', sessions,
+            lambda s: reflectiveSession(s, 'Conference'),
+            lambda s: SESSION_COPIER.copy(s,
+                conferenceDisplayName='Conference')),
+        ('speaker', speakers, reflectiveSpeaker, SPEAKER_COPIER.copy),
+    ]
+    for name, entities, before, after in pairs:
+        assert before(entities[0]) == after(entities[0]), name
+        bench('%s (reflective)' % name, before, entities)
+        bench('%s (copier)' % name, after, entities)
+
+
+if __name__ == '__main__':
+    main()
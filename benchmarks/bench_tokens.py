@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+"""
+bench_tokens.py -- benchmark of the OAuth token to user id cache of utils.py
+
+Replaces the urlfetch stub of the testbed with a local stub of the tokeninfo
+service (answering after a simulated latency), then looks up K tokens from T
+threads at once, as concurrent requests of an instance would, and from
+concurrent tasklets of a single thread. Checks that each token is fetched
+from tokeninfo once, that a new instance (empty memory cache) finds them in
+memcache, and reports the latency of each tier.
+
+    python benchmarks/bench_tokens.py [--tokens K] [--threads T]
+        [--latency MS]
+
+See harness.py for the requirements.
+
+"""
+
+import argparse
+import json
+import threading
+import time
+import urlparse
+
+from harness import Harness
+from harness import percentile
+
+from google.appengine.api import apiproxy_stub
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+import utils
+
+
+class TokenInfoStub(apiproxy_stub.APIProxyStub):
+    """TokenInfoStub -- urlfetch stub answering as the tokeninfo service"""
+
+    def __init__(self, latency):
+        super(TokenInfoStub, self).__init__('urlfetch')
+        self.latency = latency
+        self.fetches = 0
+        self.lock = threading.Lock()
+
+    def _Dynamic_Fetch(self, request, response):
+        with self.lock:
+            self.fetches += 1
+        time.sleep(self.latency)
+        query = urlparse.parse_qs(urlparse.urlsplit(request.url()).query)
+        token = (query.get('id_token') or query.get('access_token'))[0]
+        response.set_statuscode(200)
+        response.set_content(json.dumps({
+            'user_id': 'user-%s' % token,
+            'expires_in': 3600,
+        }))
+
+
+def lookup(tokens, threads):
+    """
+    Look every token up from every thread. Returns the latencies (ms) and
+    checks the user ids.
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def run():
+        for token in tokens:
+            start = time.time()
+            user_id = utils.getTokenUserId(token)
+            elapsed = (time.time() - start) * 1000
+            assert user_id == 'user-%s' % token, user_id
+            with lock:
+                latencies.append(elapsed)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies
+
+
+def lookupTasklets(tokens, tasklets):
+    """
+    Look every token up from the given number of tasklets of this thread, at
+    once. Returns the latencies (ms) and checks the user ids.
+    """
+    @ndb.tasklet
+    def run():
+        latencies = []
+        for token in tokens:
+            start = time.time()
+            user_id = yield utils.getTokenUserIdAsync(token)
+            latencies.append((time.time() - start) * 1000)
+            assert user_id == 'user-%s' % token, user_id
+        raise ndb.Return(latencies)
+
+    futures = [run() for _ in range(tasklets)]
+    return sum([future.get_result() for future in futures], [])
+
+
+def report(label, latencies, fetches):
+    print '%-24s %5d lookups  p50 %7.2fms  p99 %7.2fms  %4d fetches' % (
+            label, len(latencies), percentile(latencies, 50),
+            percentile(latencies, 99), fetches)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--tokens', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=50,
+            help='latency of the tokeninfo stub, in ms')
+    args = parser.parse_args()
+
+    harness = Harness()
+    harness.setUp()
+    try:
+        stub = TokenInfoStub(args.latency / 1000.0)
+        apiproxy_stub_map.apiproxy.ReplaceStub('urlfetch', stub)
+        tokens = ['token%d' % i for i in range(args.tokens)]
+
+        # cold: concurrent lookups of a token wait for a single fetch
+        report('cold', lookup(tokens, args.threads), stub.fetches)
+        assert stub.fetches == len(tokens), stub.fetches
+
+        # a new instance finds the tokens in memcache
+        utils._tokenCache = utils.TokenCache(utils.TOKEN_CACHE_SIZE)
+        report('memcache', lookup(tokens, args.threads),
+                stub.fetches - len(tokens))
+
+        # and then in memory
+        report('memory', lookup(tokens, args.threads),
+                stub.fetches - len(tokens))
+        assert stub.fetches == len(tokens), stub.fetches
+
+        # cold again, concurrent tasklets of a thread wait for the future of
+        # the first lookup
+        utils._tokenCache = utils.TokenCache(utils.TOKEN_CACHE_SIZE)
+        memcache.flush_all()
+        report('cold (tasklets)', lookupTasklets(tokens, args.threads),
+                stub.fetches - len(tokens))
+        assert stub.fetches == 2 * len(tokens), stub.fetches
+    finally:
+        harness.tearDown()
+
+
+if __name__ == '__main__':
+    main()
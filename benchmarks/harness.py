@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+
+"""
+harness.py -- offline benchmark harness for the Conference Central API
+
+Runs ConferenceApi methods in process against the App Engine testbed
+(datastore_v3, memcache and taskqueue stubs), recording for each method the
+latency of every call, the API RPCs it made (by service and call) and the
+peak memory of the process. Also checks that write paths don't read back the
+entities they have just written, and that they batch their writes.
+
+Needs the App Engine SDK: either dev_appserver.py in the PATH, or the SDK and
+it's bundled libraries (endpoints, webapp2, ...) in the PYTHONPATH.
+
+"""
+
+import json
+import os
+import resource
+import sys
+import time
+import urlparse
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, APP_DIR)
+
+# put the SDK libraries in the path, as the test runners of the SDK do
+try:
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+except ImportError:
+    pass
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+APP_ID = 'conference-central-1187'
+AUTH_DOMAIN = 'gmail.com'
+
+
+class ReadAfterWriteError(Exception):
+    """ReadAfterWriteError -- raised when a call gets an entity it has put"""
+
+
+class TooManyWritesError(Exception):
+    """TooManyWritesError -- raised when a call makes more put (or delete)
+    RPCs than allowed"""
+
+
+def percentile(values, p):
+    """Return the p-th percentile of the values (nearest rank)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = int(round(p / 100.0 * len(ordered) + 0.5)) - 1
+    return ordered[max(0, min(rank, len(ordered) - 1))]
+
+
+def peakMemory():
+    """Return the peak resident memory of the process, in MB"""
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class RpcRecorder(object):
+    """
+    RpcRecorder -- counts the API RPCs made while recording, by service and
+    call, and tracks the datastore keys put so gets of them can be caught.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.putKeys = set()
+        self.readAfterWrite = []
+        self.recording = False
+
+    def start(self):
+        self.counts = {}
+        self.putKeys = set()
+        self.readAfterWrite = []
+        self.recording = True
+
+    def stop(self):
+        self.recording = False
+        return self.counts
+
+    def preCall(self, service, call, request, response):
+        if not self.recording:
+            return
+        name = '%s.%s' % (service, call)
+        self.counts[name] = self.counts.get(name, 0) + 1
+        if service == 'datastore_v3' and call == 'Get':
+            for ref in request.key_list():
+                key = ndb.Key(reference=ref)
+                if key in self.putKeys:
+                    self.readAfterWrite.append(key)
+
+    def postCall(self, service, call, request, response):
+        if self.recording and service == 'datastore_v3' and call == 'Put':
+            self.putKeys.update(
+                    ndb.Key(reference=ref) for ref in response.key_list())
+
+
+class Harness(object):
+    """Harness -- testbed set up for running ConferenceApi in process"""
+
+    def __init__(self):
+        self.testbed = testbed.Testbed()
+        self.recorder = RpcRecorder()
+        self.results = {}
+
+    def setUp(self):
+        self.testbed.activate()
+        self.testbed.setup_env(app_id=APP_ID, overwrite=True)
+        # queries always see the latest writes, so the seeded data is
+        # consistent
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+                probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=APP_DIR)
+        self.testbed.init_app_identity_stub()
+        self.testbed.init_mail_stub()
+        self.testbed.init_urlfetch_stub()
+        self.testbed.init_user_stub()
+        self.taskqueue = self.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+        apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+                'benchmark', self.recorder.preCall)
+        apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(
+                'benchmark', self.recorder.postCall)
+        ndb.get_context().clear_cache()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def login(self, email):
+        """Make the endpoints user of the following calls the given one"""
+        os.environ['ENDPOINTS_AUTH_EMAIL'] = email
+        os.environ['ENDPOINTS_AUTH_DOMAIN'] = AUTH_DOMAIN
+
+    def call(self, label, method, request, checkWrites=False, maxPuts=None,
+            maxDeletes=None):
+        """
+        Call the API method as a new request would (with an empty context
+        cache), recording it's latency and RPCs under the label. If
+        checkWrites is set, raises ReadAfterWriteError if the call got any
+        entity it had put. If maxPuts (maxDeletes) is set, raises
+        TooManyWritesError if the call made more datastore put (delete) RPCs.
+        """
+        ndb.get_context().clear_cache()
+        self.recorder.start()
+        start = time.time()
+        try:
+            response = method(request)
+        finally:
+            elapsed = time.time() - start
+            counts = self.recorder.stop()
+        result = self.results.setdefault(label, {'latency': [], 'rpcs': {}})
+        result['latency'].append(elapsed * 1000)
+        for name, count in counts.items():
+            result['rpcs'][name] = result['rpcs'].get(name, 0) + count
+        result['memory'] = peakMemory()
+        if checkWrites and self.recorder.readAfterWrite:
+            raise ReadAfterWriteError('%s read back %s' % (
+                label, ', '.join(map(repr, self.recorder.readAfterWrite))))
+        puts = counts.get('datastore_v3.Put', 0)
+        if maxPuts is not None and puts > maxPuts:
+            raise TooManyWritesError('%s made %d put RPCs (at most %d)' % (
+                label, puts, maxPuts))
+        deletes = counts.get('datastore_v3.Delete', 0)
+        if maxDeletes is not None and deletes > maxDeletes:
+            raise TooManyWritesError('%s made %d delete RPCs (at most %d)' % (
+                label, deletes, maxDeletes))
+        return response
+
+    def runTasks(self, app):
+        """
+        Run the queued push tasks (and the ones they queue) on the given app.
+        The tasks of pull queues are left for their workers.
+        """
+        import webapp2
+        while True:
+            tasks = [task for task in self.taskqueue.get_filtered_tasks()\
+                    if task.method != 'PULL']
+            if not tasks:
+                return
+            for queue in set(task.queue_name for task in tasks):
+                self.taskqueue.FlushQueue(queue)
+            for task in tasks:
+                request = webapp2.Request.blank(
+                        urlparse.urlsplit(task.url).path,
+                        POST=task.payload or '',
+                        headers={
+                            'Content-Type':
+                                'application/x-www-form-urlencoded'})
+                request.method = task.method
+                request.get_response(app)
+
+    def report(self):
+        """Return the results as a dict of per label statistics"""
+        report = {}
+        for label, result in self.results.items():
+            latency = result['latency']
+            calls = len(latency)
+            report[label] = {
+                'calls': calls,
+                'p50': percentile(latency, 50),
+                'p90': percentile(latency, 90),
+                'p99': percentile(latency, 99),
+                'max': max(latency),
+                'rpcsPerCall': dict((name, float(count) / calls)\
+                        for name, count in result['rpcs'].items()),
+                'memoryMB': result['memory'],
+            }
+        return report
+
+
+def printReport(report, baseline=None):
+    """Print the report, along with the change from the baseline (if any)"""
+    for label in sorted(report):
+        stats = report[label]
+        line = '%-28s %5d calls  p50 %7.2fms  p90 %7.2fms  p99 %7.2fms' % (
+                label, stats['calls'], stats['p50'], stats['p90'],
+                stats['p99'])
+        rpcs = sum(stats['rpcsPerCall'].values())
+        line += '  %6.1f rpcs/call  %6.1fMB' % (rpcs, stats['memoryMB'])
+        if baseline and label in baseline:
+            before = baseline[label]
+            line += '  (p50 %+.0f%%, rpcs %+.1f)' % (
+                (stats['p50'] / before['p50'] - 1) * 100 if before['p50']\
+                        else 0,
+                rpcs - sum(before['rpcsPerCall'].values()))
+        print line
+        for name in sorted(stats['rpcsPerCall']):
+            print '    %-40s %6.1f' % (name, stats['rpcsPerCall'][name])
+
+
+def saveReport(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def loadReport(path):
+    with open(path) as f:
+        return json.load(f)
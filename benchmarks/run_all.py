@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+"""
+run_all.py -- run every benchmark of the Conference Central API
+
+Runs bench_api.py, bench_tokens.py, bench_admission.py and bench_copiers.py
+in turn, each in it's own process (the testbed and the patched module
+globals don't carry over), saving their output under OUT (and the bench_api
+report as OUT/api.json, compared with --baseline if given). Fails if any of
+them fails, e.g. on a write check (maxPuts, checkWrites), a cache check or
+an overselling check. Meant to be run before merging changes to the write
+or cache paths, recording the numbers along with the change.
+
+    python benchmarks/run_all.py [--out OUT] [--baseline FILE]
+
+See harness.py for the requirements.
+
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def benchmarks(out, baseline):
+    """Return the name and arguments of each benchmark to run"""
+    api = ['--save', os.path.join(out, 'api.json')]
+    if baseline:
+        api += ['--baseline', baseline]
+    return [
+        ('bench_api.py', api),
+        ('bench_tokens.py', []),
+        ('bench_admission.py', ['--shards', '1', '5', '10', '20']),
+        ('bench_copiers.py', []),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--out', default='bench-results',
+            help='directory of the outputs')
+    parser.add_argument('--baseline', help='bench_api report to compare with')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.out):
+        os.makedirs(args.out)
+    failed = []
+    for script, script_args in benchmarks(args.out, args.baseline):
+        print '== %s %s' % (script, ' '.join(script_args))
+        output = os.path.join(args.out, script.replace('.py', '.txt'))
+        with open(output, 'w') as f:
+            process = subprocess.Popen(
+                    [sys.executable, os.path.join(BENCH_DIR, script)] +\
+                        script_args,
+                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            for line in iter(process.stdout.readline, ''):
+                sys.stdout.write(line)
+                f.write(line)
+            if process.wait() != 0:
+                failed.append(script)
+    if failed:
+        print 'FAILED: %s' % ', '.join(failed)
+        sys.exit(1)
+    print 'All benchmarks passed, outputs in %s' % args.out
+
+
+if __name__ == '__main__':
+    main()
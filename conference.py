@@ -16,22 +16,33 @@ __author__ = 'wesc+api@google.com (Wesley Chun)'
 from datetime import datetime
 from datetime import time
 from datetime import date
+import operator
 
 import endpoints
 from protorpc import messages
 from protorpc import message_types
 from protorpc import remote
 
+from google.appengine.api import datastore_errors
 from google.appengine.api import memcache
+from google.appengine.api import oauth
 from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
 
 from models import ConflictException
 from models import Profile
+from models import ProcessedRequest
+from models import Registration
+from models import WishlistEntry
 from models import ProfileMiniForm
 from models import ProfileForm
 from models import StringMessage
 from models import BooleanMessage
+from models import CacheStatsForm
+from models import MethodPerfForm
+from models import PerfStatsForm
+from models import RpcCountForm
+from models import RegistrationStatusForm
 from models import Conference
 from models import ConferenceForm
 from models import ConferenceUpdateForm
@@ -44,6 +55,7 @@ from models import SessionForm
 from models import SessionUpdateForm
 from models import SessionForms
 from models import Speaker
+from models import ConferenceSpeakerStats
 from models import SpeakerForm
 #from models import SpeakerUpdateForm
 from models import SpeakerForms
@@ -54,14 +66,35 @@ from settings import IOS_CLIENT_ID
 from settings import ANDROID_AUDIENCE
 
 from utils import getUserId
+import seats
+import admission
+import announcements
+import formcache
+import perf
+import querycache
+import unitofwork
+from copiers import CONFERENCE_COPIER
+from copiers import PROFILE_COPIER
+from copiers import SESSION_COPIER
+from copiers import SPEAKER_COPIER
 
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
-MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
-ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
-                    'are nearly sold out: %s')
+# user id, wishlist version, page size and page token; holds the session keys
+# of the page and the next page token
+MEMCACHE_WISHLIST_KEY = "WISHLIST_KEYS:%s:%s:%d:%s"
+WISHLIST_CACHE_TIME = 600
 FEATURED_SPEAKER_TPL = ('You should not miss the following sessions by our '
                     'featured speaker %s: %s')
+# id of the ConferenceSpeakerStats entity of each conference
+SPEAKER_STATS_ID = 'speakers'
+# number of entities handled by each run of the migration tasks
+MIGRATION_BATCH_SIZE = 100
+# maximum number of sessions created by a single createSessionsBulk call. They
+# are all written in a single transaction, along with the speaker stats.
+MAX_BULK_SESSIONS = 400
+# maximum number of entity groups in a cross group transaction
+XG_MAX_ENTITY_GROUPS = 25
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 DEFAULTS = {
@@ -69,6 +102,7 @@ DEFAULTS = {
     "maxAttendees": 0,
     "seatsAvailable": 0,
     "topics": [ "Default", "Topic" ],
+    "queuedAdmission": False,
 }
 
 SESSION_DEFAULTS = {
@@ -92,6 +126,18 @@ OPERATORS = {
             'NE':   '!='
             }
 
+# python callables for each of the operators above. Applied to a ndb property
+# they return a datastore filter, while applied to plain values they are used
+# for filtering entities in memory.
+OPERATOR_FUNCS = {
+            '=':    operator.eq,
+            '>':    operator.gt,
+            '>=':   operator.ge,
+            '<':    operator.lt,
+            '<=':   operator.le,
+            '!=':   operator.ne,
+            }
+
 FIELDS =    {
             'CITY': 'city',
             'TOPIC': 'topics',
@@ -107,15 +153,54 @@ SESSION_FIELDS = {
         'DURATION': 'duration',
         }
 
+# session fields in the order they are preferred for the datastore inequality
+# filter of querySessions, from the most to the least selective. A conference
+# lasts only a few days, so a date range usually leaves very few sessions.
+SESSION_FIELDS_SELECTIVITY = [
+        'date',
+        'startTime',
+        'duration',
+        'typeOfSession',
+        'highlights',
+        ]
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# maximum number of entities a single request may examine when filtering in
+# memory. Once reached, the page is returned as is (possibly with less items
+# than requested) along with the token for resuming the query.
+MAX_SCANNED_PER_PAGE = 500
+
+# views of the list endpoints. The SUMMARY view only returns the fields shown
+# by the lists, which are fetched with projection queries.
+VIEWS = ('FULL', 'SUMMARY')
+# properties fetched by the summary views. Only indexed, not repeated
+# properties can be projected (see index.yaml for the indexes needed).
+CONFERENCE_SUMMARY_FIELDS = ('name', 'city', 'startDate', 'maxAttendees',
+        'seatsAvailable', 'organizerDisplayName')
+SESSION_SUMMARY_FIELDS = ('name', 'typeOfSession', 'date', 'startTime',
+        'duration', 'speakerDisplayName')
+
 CONF_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1, required=True),
 )
 
+CONF_GET_PAGE_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1, required=True),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(3),
+    view=messages.StringField(4),
+)
+
 CONF_GET_BY_TYPE_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
     sessionType=messages.StringField(2, required=True),
+    pageSize=messages.IntegerField(3, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(4),
+    view=messages.StringField(5),
 )
 
 CONF_POST_REQUEST = endpoints.ResourceContainer(
@@ -126,6 +211,15 @@ CONF_POST_REQUEST = endpoints.ResourceContainer(
 CONF_POST_UPDATE_REQUEST = endpoints.ResourceContainer(
     ConferenceUpdateForm,
     websafeConferenceKey=messages.StringField(1),
+    requestId=messages.StringField(2),
+)
+
+# requestId is an optional token chosen by the client, so retries of the same
+# request are only applied once
+CONF_REGISTER_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1, required=True),
+    requestId=messages.StringField(2),
 )
 
 SESSION_GET_REQUEST = endpoints.ResourceContainer(
@@ -138,6 +232,11 @@ SESSION_POST_REQUEST = endpoints.ResourceContainer(
     websafeConferenceKey=messages.StringField(3)
 )
 
+SESSIONS_BULK_POST_REQUEST = endpoints.ResourceContainer(
+    SessionForms,
+    websafeConferenceKey=messages.StringField(5, required=True),
+)
+
 SESSION_POST_UPDATE_REQUEST = endpoints.ResourceContainer(
     SessionUpdateForm,
     websafeSessionKey=messages.StringField(1),
@@ -146,10 +245,33 @@ SESSION_POST_UPDATE_REQUEST = endpoints.ResourceContainer(
 SPEAKER_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeSpeakerKey=messages.StringField(1, required=True),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(3),
 )
 
 ADD_SESSION_POST_REQUEST = endpoints.ResourceContainer(
         websafeSessionKey=messages.StringField(1, required=True),
+        lightweight=messages.BooleanField(2),
+)
+
+WISHLIST_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    pageSize=messages.IntegerField(1, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(2),
+    etag=messages.StringField(3),
+)
+
+PAGE_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    pageSize=messages.IntegerField(1, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(2),
+)
+
+VIEW_PAGE_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    pageSize=messages.IntegerField(1, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(2),
+    view=messages.StringField(3),
 )
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -162,6 +284,8 @@ ADD_SESSION_POST_REQUEST = endpoints.ResourceContainer(
         ANDROID_CLIENT_ID,
         IOS_CLIENT_ID],
     scopes=[EMAIL_SCOPE])
+@perf.profileService
+@unitofwork.unitOfWorkService
 class ConferenceApi(remote.Service):
     """Conference API v0.1"""
 
@@ -172,76 +296,65 @@ class ConferenceApi(remote.Service):
 # They may be updated, however, in order for the authorized user to insert
 # attributes other than it's name.
 
-    def _checkFeaturedSpeaker(self, websafeSpeakerKey, websafeConferenceKey):
+    @staticmethod
+    def _checkFeaturedSpeaker(websafeConferenceKey, transactional=False):
         """
-        Method used to create the task which will be used to check if the
-        newly created or updated speaker is to be considered a featured speaker
+        Method used to create the task which will render the announcement of
+        the conference featured speaker, once it has changed
         """
         taskqueue.add(
                 params={
-                    'websafeSpeakerKey': websafeSpeakerKey,
                     'websafeConferenceKey': websafeConferenceKey,
                 },
-                url='/tasks/set_featured_speaker')
-
+                url='/tasks/set_featured_speaker',
+                transactional=transactional)
 
-    def _createSpeakerObject(self, request, session_key):
-        """method responsible for the actual creation of the speaker object"""
-        # First we check to see if the speaker already exists
-        sp = Speaker.query(Speaker.name==getattr(request, 'name')).get()
-        conf_key = session_key.parent()
-        if sp:
-            # if it does, we simply append the newly created session key to it
-            sp.sessions.append(session_key)
-            sp.put()
-            # if speaker exists, we check if it's a featured speaker
-            self._checkFeaturedSpeaker(sp.key.urlsafe(), conf_key.urlsafe())
-            return self._copySpeakerToForm(sp, session_key.get().name)
 
-        # otherwise, we create a new speaker entity
-        s = session_key.get()
+    def _speakerData(self, request):
+        """Copy a SpeakerForm into a dict of the properties of a new speaker"""
         data = { field.name: getattr(request, field.name)\
                 for field in request.all_fields() }
         del data['websafeKey']
-        # in case the speaker does not exist, it's only session is the newly
-        # created
-        data['sessions'] = [session_key,]
+        del data['sessions']
 
         # sets the default options
         for df in SPEAKER_DEFAULTS:
             data[df] = SPEAKER_DEFAULTS[df]
+        return data
 
-        # generate the speaker id based on the session key
-        sp_id = Speaker.allocate_ids(size=1)[0]
 
-        # create speaker key
-        sp_key = ndb.Key(Speaker, sp_id)
-        data['key'] = sp_key
-
-        # save to db and return
-        Speaker(**data).put()
+    @unitofwork.transactional()
+    def _addSessionToSpeaker(self, sp_key, session_key, data, update=None):
+        """
+        Append the session to the sessions of the speaker, creating the speaker
+        with the given data if it does not exist, or else setting the fields
+        given in the update form (if any). Being transactional, two sessions
+        created at once for a new speaker do not end up creating two different
+        speakers, nor does an update lose a session appended meanwhile.
+        Returns the speaker and whether it already existed. When called from
+        another transaction, the speaker is written along with the rest of
+        it's entities.
+        """
         sp = sp_key.get()
-        # if speaker does not already exist, we do not need to worry about it
-        # being featured.
-        return self._copySpeakerToForm(sp, s.name)
+        existed = sp is not None
+        if not existed:
+            sp = Speaker(key=sp_key, **data)
+        elif update:
+            for field in update.all_fields():
+                value = getattr(update, field.name)
+                if value not in (None, []):
+                    setattr(sp, field.name, value)
+        if session_key not in sp.sessions:
+            sp.sessions.append(session_key)
+        unitofwork.add(sp)
+        return (sp, existed)
 
 
+    @perf.timed
     def _copySpeakerToForm(self, speaker, displayName):
         """Copy Speaker fields from request to SpeakerForm"""
-        spForm = SpeakerForm()
-        for field in spForm.all_fields():
-            if field.name == "sessions":
-                sessions = []
-                for session in getattr(speaker, field.name):
-                    sessions.append(session.urlsafe())
-                setattr(spForm, field.name, sessions)
-            elif hasattr(speaker, field.name):
-                setattr(spForm, field.name, getattr(speaker, field.name))
-            elif field.name == "websafeKey":
-                setattr(spForm, field.name, speaker.key.urlsafe())
-
-        spForm.check_initialized()
-        return spForm
+        # the fields to copy are worked out once, at import (see copiers.py)
+        return SPEAKER_COPIER.copy(speaker)
 
 
     @endpoints.method(SESSION_GET_REQUEST, SpeakerForm,
@@ -249,7 +362,21 @@ class ConferenceApi(remote.Service):
             http_method='GET', name='getSessionSpeaker')
     def getSessionSpeaker(self, request):
         """Get speaker associated with a given session"""
-        s = ndb.Key(urlsafe=request.websafeSessionKey).get()
+        return self._getSessionSpeakerAsync(request).get_result()
+
+
+    @ndb.tasklet
+    def _getSessionSpeakerAsync(self, request):
+        """
+        Tasklet implementing getSessionSpeaker. The SpeakerForm is cached under
+        the session key, so it is invalidated along with the session forms.
+        """
+        s_key = ndb.Key(urlsafe=request.websafeSessionKey)
+        forms, versions = yield formcache.getAsync(
+                SpeakerForm, [s_key.urlsafe()])
+        if forms[0]:
+            raise ndb.Return(forms[0])
+        s = yield s_key.get_async()
         if not s:
             raise endpoints.NotFoundException(
                 'No session found with key: %s'
@@ -259,86 +386,154 @@ class ConferenceApi(remote.Service):
                 'No speaker registered for session with key: %s'
                  % request.websafeSessionKey)
 
-        speaker = Speaker.query(Speaker.name==s.speakerDisplayName).get()
-        return self._copySpeakerToForm(speaker, s.name)
+        speaker = yield (s.speakerKey or\
+                Speaker.keyForName(s.speakerDisplayName)).get_async()
+        if not speaker:
+            raise endpoints.NotFoundException(
+                'No speaker found for session with key: %s'
+                 % request.websafeSessionKey)
+        form = self._copySpeakerToForm(speaker, s.name)
+        yield formcache.setAsync(SpeakerForm, [s_key.urlsafe()], versions,
+                [form])
+        raise ndb.Return(form)
 
 
-    def _updateSpeakerObject(self, request, websafeConferenceKey,
-            former_speaker_name, session_key):
-        '''
-        Update method for speaker entities.
-        '''
-        # first, if the name of the speaker is to be updated, we check to see
-        # if there is already a speaker with same name. If so, we use it. Else,
-        # we use the former speaker entity
+    @staticmethod
+    def _getSpeakerStats(c_key):
+        """
+        Return the ConferenceSpeakerStats of the conference. For conferences
+        created before the stats existed, they are computed from the
+        conference sessions (this is an ancestor query, so it may run inside
+        the session transactions).
+        """
+        stats = ConferenceSpeakerStats.get_by_id(SPEAKER_STATS_ID, parent=c_key)
+        if stats:
+            return stats
+        stats = ConferenceSpeakerStats(id=SPEAKER_STATS_ID, parent=c_key,
+                speakerSessions={})
+        for session in Session.query(ancestor=c_key):
+            sp_key = ConferenceApi._sessionSpeakerKey(session)
+            if sp_key:
+                stats.speakerSessions.setdefault(sp_key.id(), []).append(
+                        session.key.id())
+        return stats
+
+
+    @staticmethod
+    def _sessionSpeakerKey(session):
+        """Return the key of the session speaker, if any"""
+        if session.speakerKey:
+            return session.speakerKey
+        if session.speakerDisplayName:
+            return Speaker.keyForName(session.speakerDisplayName)
+        return None
+
+
+    @staticmethod
+    def _updateSpeakerStats(stats, session, former_speaker_key=None):
+        """
+        Move the session from it's former speaker to it's current one in the
+        conference stats and recompute the featured speaker, which is the one
+        with the most sessions (if more than one). In case of a tie, the
+        current featured speaker is kept. Returns whether the featured speaker
+        (or it's sessions) changed.
+        """
+        counts = stats.speakerSessions
+        featured = stats.featuredSpeaker
+        before = (featured, list(counts.get(featured, [])))
+
+        s_id = session.key.id()
+        sp_key = ConferenceApi._sessionSpeakerKey(session)
+        if former_speaker_key and former_speaker_key != sp_key:
+            ids = counts.get(former_speaker_key.id(), [])
+            if s_id in ids:
+                ids.remove(s_id)
+            if not ids:
+                counts.pop(former_speaker_key.id(), None)
+        if sp_key and s_id not in counts.setdefault(sp_key.id(), []):
+            counts[sp_key.id()].append(s_id)
+
+        if counts:
+            best = max(counts, key=lambda sp_id: len(counts[sp_id]))
+            if featured not in counts or\
+                    len(counts[best]) > len(counts[featured]):
+                featured = best
+        if featured and len(counts.get(featured, [])) < 2:
+            featured = None
+        stats.featuredSpeaker = featured
+        return (featured, list(counts.get(featured, []))) != before
+
+
+    @unitofwork.transactional(xg=True)
+    def _putSession(self, session, former_speaker_key=None,
+            speaker_form=None, update_speaker=False):
+        """
+        Save the session along with the speaker stats of it's conference, and
+        add it to the sessions of it's speaker if a SpeakerForm is given
+        (creating the speaker if needed), all in one write. With
+        update_speaker, the form is a SpeakerUpdateForm whose fields are set
+        on the speaker if it exists. If the featured speaker changed, a task
+        is queued to render it's announcement. Returns the speaker, if any.
+        """
+        c_key = session.key.parent()
+        stats = self._getSpeakerStats(c_key)
+        changed = self._updateSpeakerStats(stats, session, former_speaker_key)
+        unitofwork.add(session, stats)
         speaker = None
-        if request.name:
-            speaker = Speaker.query(Speaker.name==request.name).get()
-        else:
-            speaker = Speaker.query(Speaker.name==former_speaker_name).get()
-        # if speaker exists, we update it with the request parameters
-        if speaker is not None:
-            for field in request.all_fields():
-                data = getattr(request, field.name)
-                if data not in (None, []):
-                    setattr(speaker, field.name, data)
-            if session_key not in speaker.sessions:
-                speaker.sessions.append(session_key)
-            # save updated speaker to db and check if featured it is a
-            # featured speaker
-            speaker.put()
-            self._checkFeaturedSpeaker(
-                    speaker.key.urlsafe(), websafeConferenceKey)
-            # return form
-            return self._copySpeakerToForm(speaker, "")
-        # else, meaning there was no speaker with the name provided in the
-        # updated form, nor former speaker registered with the session.
-        # generate the dict with all data in the request.
-        data = { field.name: getattr(request, field.name)\
-                for field in request.all_fields() }
-        data['sessions'] = [session_key,]
-        sp_id = Speaker.allocate_ids(size=1)[0]
-        sp_key = ndb.Key(Speaker, sp_id)
-        data['key'] = sp_key
-        # save to db and return form
-        Speaker(**data).put()
-        return self._copySpeakerToForm(sp_key.get(), "")
+        if speaker_form:
+            # speakers are keyed by their normalized name, so there is no need
+            # to query for them. The data is only used if the speaker does not
+            # exist yet.
+            name = speaker_form.name or session.speakerDisplayName
+            if update_speaker:
+                data = {field.name: getattr(speaker_form, field.name)\
+                        for field in speaker_form.all_fields()}
+                data['name'] = name
+                update = speaker_form
+            else:
+                data, update = self._speakerData(speaker_form), None
+            speaker, _ = self._addSessionToSpeaker(Speaker.keyForName(name),
+                    session.key, data, update)
+        if changed:
+            self._checkFeaturedSpeaker(c_key.urlsafe(), transactional=True)
+        return speaker
+
+
+    @ndb.transactional()
+    def _putSessions(self, c_key, sessions):
+        """
+        Save new sessions of the conference along with it's speaker stats,
+        queueing a single task to render the featured speaker if it changed.
+        """
+        stats = self._getSpeakerStats(c_key)
+        changed = False
+        for session in sessions:
+            changed = self._updateSpeakerStats(stats, session) or changed
+        ndb.put_multi(sessions + [stats])
+        if changed:
+            self._checkFeaturedSpeaker(c_key.urlsafe(), transactional=True)
 
 
     @staticmethod
-    def _cacheFeaturedSpeaker(websafeSpeakerKey, websafeConferenceKey):
+    def _cacheFeaturedSpeaker(websafeConferenceKey):
         '''
-        Checks if the given speaker is giving more than one session in the
-        given conference. If so, save it's announcement to the memcache as the
-        conference featured speaker.
-
-        NOTE: Tried iterating through the conference sessions instead, as
-        suggested in the last review. However, if I were to follow this
-        approach, for every conference session I would have to query it's
-        speaker in order to compare it with the given speaker. For that reason,
-        I chose to keep things as they are.
+        Render the announcement of the conference featured speaker, as found in
+        the conference speaker stats, and save it to the memcache. Returns the
+        announcement ('' if there is no featured speaker).
         '''
-        # Get the speaker by its websafeKey
-        speaker = ndb.Key(urlsafe=websafeSpeakerKey).get()
-        # initialize the counter and the list which will hold the name of the
-        # sessions of this conference given by the speaker
-        count = 0
-        session_list = []
-        # iterate all speaker sessions
-        for session in speaker.sessions:
-            # grabs the session conference and checks if it's the same
-            # conference of the newly created session (if so, increments the
-            # counter and appends the session name to the list of sessions).
-            if session.parent().urlsafe() == websafeConferenceKey:
-                count += 1
-                session_list.append(session)
-        # if the counter is greater than 1 (meaning the speaker has another
-        # session in the conference, besides the newly created session), it is
-        # a featured speaker and shall be added to memcache.
-        if count > 1:
-            sessions = [session.get().name for session in session_list]
-            featured = FEATURED_SPEAKER_TPL % (speaker.name, sessions,)
-            memcache.set(websafeConferenceKey, featured)
+        c_key = ndb.Key(urlsafe=websafeConferenceKey)
+        stats = ConferenceSpeakerStats.get_by_id(SPEAKER_STATS_ID, parent=c_key)
+        featured = ""
+        if stats and stats.featuredSpeaker:
+            sessions = ndb.get_multi([ndb.Key(Session, s_id, parent=c_key)\
+                    for s_id in stats.speakerSessions[stats.featuredSpeaker]])
+            sessions = [session for session in sessions if session]
+            if sessions:
+                featured = FEATURED_SPEAKER_TPL % (
+                        sessions[0].speakerDisplayName,
+                        [session.name for session in sessions],)
+        memcache.set(websafeConferenceKey, featured)
+        return featured
 
 
     @endpoints.method(CONF_GET_REQUEST, StringMessage,
@@ -346,38 +541,158 @@ class ConferenceApi(remote.Service):
             http_method='GET', name='getFeaturedSpeaker')
     def getFeaturedSpeaker(self, request):
         """Return featured speaker from memcache."""
-        return StringMessage(
-                data=memcache.get(request.websafeConferenceKey) or "")
+        featured = memcache.get(request.websafeConferenceKey)
+        if featured is None:
+            featured = self._cacheFeaturedSpeaker(request.websafeConferenceKey)
+        return StringMessage(data=featured)
+
+
+    @staticmethod
+    def _migrateSpeakers(websafeCursor=None):
+        """
+        Re-key a batch of the speakers created before speakers were keyed by
+        their normalized name, merging the ones sharing the same name. Returns
+        the cursor for the next batch, or None once all have been migrated.
+        """
+        cursor = ndb.Cursor(urlsafe=websafeCursor) if websafeCursor else None
+        # integer ids sort before string ones, so the speakers created by the
+        # migration only show up at the end of the query
+        speakers, cursor, more = Speaker.query().order(Speaker.key).fetch_page(
+                MIGRATION_BATCH_SIZE, start_cursor=cursor, keys_only=True)
+        for sp_key in speakers:
+            if not isinstance(sp_key.id(), (int, long)):
+                return None
+            speaker = ConferenceApi._mergeSpeaker(sp_key)
+            if not speaker:
+                continue
+            # rewrite the speaker name of the sessions, as it may have been
+            # spelled differently by each of the merged speakers
+            sessions = [s for s in ndb.get_multi(speaker.sessions)\
+                    if s and s.speakerDisplayName != speaker.name]
+            for s in sessions:
+                s.speakerDisplayName = speaker.name
+            ndb.put_multi(sessions)
+            formcache.invalidate([s_key.urlsafe() for s_key in speaker.sessions])
+        return cursor.urlsafe() if more and cursor else None
+
+
+    @staticmethod
+    @ndb.transactional(xg=True)
+    def _mergeSpeaker(old_key):
+        """
+        Merge the speaker into the one keyed by it's normalized name (which is
+        created if needed) and delete it. Returns the merged speaker.
+        """
+        old = old_key.get()
+        if not old:
+            return None
+        new_key = Speaker.keyForName(old.name)
+        speaker = new_key.get()
+        if not speaker:
+            speaker = Speaker(key=new_key, **old.to_dict())
+        else:
+            # keep the data already in the merged speaker, filling in the
+            # blanks and joining the lists
+            for field in ('city', 'country'):
+                if not getattr(speaker, field):
+                    setattr(speaker, field, getattr(old, field))
+            for field in ('specialties', 'languages', 'sessions'):
+                values = getattr(speaker, field)
+                values.extend(v for v in getattr(old, field)\
+                        if v not in values)
+        speaker.put()
+        old_key.delete()
+        return speaker
+
+
+    @staticmethod
+    def _backfillSessionSpeakers(websafeCursor=None):
+        """
+        Set the speakerKey of a batch of the sessions created before sessions
+        held the key of their speaker. Returns the cursor for the next batch,
+        or None once all sessions have been visited.
+        """
+        cursor = ndb.Cursor(urlsafe=websafeCursor) if websafeCursor else None
+        sessions, cursor, more = Session.query().fetch_page(
+                MIGRATION_BATCH_SIZE, start_cursor=cursor)
+        sessions = [s for s in sessions\
+                if s.speakerDisplayName and not s.speakerKey]
+        for s in sessions:
+            s.speakerKey = Speaker.keyForName(s.speakerDisplayName)
+        ndb.put_multi(sessions)
+        formcache.invalidate([s.key.urlsafe() for s in sessions])
+        return cursor.urlsafe() if more and cursor else None
 
 
 # - - - Session objects - - - - - - - - - - - - - - - - -
 
 
+    @perf.timed
     def _copySessionToForm(self, session, displayName, speaker_form=None):
         """Copy session fields to SessionForm."""
-        sessionForm = SessionForm()
-        for field in sessionForm.all_fields():
-            if hasattr(session, field.name):
-                # converts time and date objects to string
-                if field.name in ["date", "startTime"]:
-                    setattr(
-                            sessionForm,
-                            field.name,
-                            str(getattr(session, field.name)))
-                else:
-                    setattr(
-                            sessionForm,
-                            field.name,
-                            getattr(session, field.name))
-            elif field.name == "websafeKey":
-                setattr(sessionForm, field.name, session.key.urlsafe())
-            elif field.name == 'speaker':
-                if speaker_form:
-                    setattr(sessionForm, field.name, speaker_form)
-        if displayName:
-            setattr(sessionForm, 'conferenceDisplayName', displayName)
-        sessionForm.check_initialized()
-        return sessionForm
+        # time and date objects are converted to string by the copier
+        return SESSION_COPIER.copy(session,
+                speaker=speaker_form,
+                conferenceDisplayName=displayName)
+
+
+    @ndb.tasklet
+    def _copySessionsToFormsAsync(self, sessions, displayNames=None):
+        """
+        Copy a list of sessions to SessionForms, along with the SpeakerForm of
+        their speakers, which are all fetched with a single get_multi.
+        displayNames maps the conference keys to the conference names.
+        """
+        displayNames = displayNames or {}
+        sp_keys = list(set(s.speakerKey for s in sessions if s.speakerKey))
+        speakers = yield ndb.get_multi_async(sp_keys)
+        spForms = dict((sp.key, self._copySpeakerToForm(sp, ''))\
+                for sp in speakers if sp)
+        raise ndb.Return([
+            self._copySessionToForm(
+                session,
+                displayNames.get(session.key.parent()),
+                spForms.get(session.speakerKey))\
+            for session in sessions])
+
+
+    def _copySessionsToForms(self, sessions, displayNames=None):
+        """Synchronous version of _copySessionsToFormsAsync"""
+        return self._copySessionsToFormsAsync(
+                sessions, displayNames).get_result()
+
+
+    @ndb.tasklet
+    def _getSessionFormsAsync(self, s_keys, displayNames=None):
+        """
+        Return the SessionForms of the sessions with the given keys, taking
+        them from the form cache when possible. Only the sessions missing from
+        the cache are fetched (skipping the ones that no longer exist). The
+        conference names in displayNames (if any) take precedence over the one
+        stored in the sessions, which may not be backfilled yet.
+        """
+        displayNames = displayNames or {}
+        websafeKeys = [s_key.urlsafe() for s_key in s_keys]
+        forms, versions = yield formcache.getAsync(SessionForm, websafeKeys)
+        missing = [i for i, form in enumerate(forms) if form is None]
+        if missing:
+            sessions = yield ndb.get_multi_async([s_keys[i] for i in missing])
+            found = [(i, s) for i, s in zip(missing, sessions) if s]
+            built = yield self._copySessionsToFormsAsync(
+                    [s for _, s in found])
+            yield formcache.setAsync(SessionForm,
+                    [websafeKeys[i] for i, _ in found],
+                    [versions[i] for i, _ in found],
+                    built)
+            for (i, _), form in zip(found, built):
+                forms[i] = form
+        result = []
+        for s_key, form in zip(s_keys, forms):
+            if form is not None:
+                if s_key.parent() in displayNames:
+                    form.conferenceDisplayName = displayNames[s_key.parent()]
+                result.append(form)
+        raise ndb.Return(result)
 
 
     @endpoints.method(SESSION_POST_REQUEST, SessionForm,
@@ -410,10 +725,51 @@ class ConferenceApi(remote.Service):
         if not request.name:
             raise endpoints.BadRequestException("Session 'name' field required")
 
+        data, speaker_form = self._sessionData(request)
+
+        # generate the session key based on the conference key. The key is
+        # needed in advance, as the speaker stats written in the same
+        # transaction hold the session id.
+        s_id = Session.allocate_ids(
+                size=1,
+                parent=c_key)[0]
+
+        # create session key
+        s_key = ndb.Key(Session, s_id, parent=c_key)
+        data['key'] = s_key
+        data['conferenceId'] = request.conferenceId = c_key.id()
+        # the conference name is kept in the session, so session listings
+        # don't need to fetch the conferences
+        data['conferenceDisplayName'] = conf.name
+
+        # save to db, along with the conference speaker stats and the speaker
+        # (created from the speaker form, if it does not exist yet)
+        session = Session(**data)
+        speaker = self._putSession(session, speaker_form=speaker_form)
+
+        if speaker:
+            # the form is built from the speaker just written
+            speaker_form = self._copySpeakerToForm(speaker, '')
+            # the other sessions of the speaker embed it's SpeakerForm, which
+            # now lists one more session, so their cached forms are stale
+            formcache.invalidate(speaker_form.sessions)
+
+        # return form, built from the session just written (no need to read
+        # it back)
+        return self._copySessionToForm(session, getattr(conf, 'name'),
+                speaker_form)
+
+
+    def _sessionData(self, request):
+        """
+        Copy a SessionForm into a dict of Session properties, setting the
+        default options and converting dates and times. Returns the dict and
+        the SpeakerForm of the session (if any).
+        """
         # copy ConferenceForm/ProtoRPC Message into dict
         data = { field.name: getattr(request, field.name)\
                 for field in request.all_fields() }
-        del data['websafeConferenceKey']
+        data.pop('websafeConferenceKey', None)
         del data['websafeKey']
         del data['conferenceDisplayName']
 
@@ -446,36 +802,129 @@ class ConferenceApi(remote.Service):
             data['duration'] = datetime.strptime(
                     data['duration'], "%H:%M").time()
         '''
-        # generate the session key based on the conference key
-        s_id = Session.allocate_ids(
-                size=1,
-                parent=c_key)[0]
-
-        # create session key
-        s_key = ndb.Key(Session, s_id, parent=c_key)
-        data['key'] = s_key
-        data['conferenceId'] = request.conferenceId = c_key.id()
-
         # get the speaker form, delete it from the data (as it is not used by
         # the session model) and sets the speaker display name.
         speaker_form = None
         if data['speaker']:
             speaker_form = data['speaker']
+            if not speaker_form.name:
+                raise endpoints.BadRequestException(
+                        "Speaker 'name' field required")
             data['speakerDisplayName'] = getattr(speaker_form, 'name')
+            data['speakerKey'] = Speaker.keyForName(speaker_form.name)
         del data['speaker']
+        return (data, speaker_form)
 
-        # save to db
-        Session(**data).put()
 
-        # handle speaker creation. session form contains a speaker form, which,
-        # if not none, we pass to the speaker creation method. we call it after
-        # the session creation as we also need the session key.
-        if speaker_form:
-            speaker_form = self._createSpeakerObject(speaker_form, s_key)
+    @endpoints.method(SESSIONS_BULK_POST_REQUEST, SessionForms,
+            path='conference/{websafeConferenceKey}/sessions/bulk',
+            http_method='POST', name='createSessionsBulk')
+    def createSessionsBulk(self, request):
+        """
+        Create several sessions (and their speakers) attached to a given
+        conference at once, e.g. when importing the whole agenda.
+        """
+        return self._createSessionsBulk(request)
 
-        # return form
-        return self._copySessionToForm(s_key.get(), getattr(conf, 'name'),
-                speaker_form)
+
+    def _createSessionsBulk(self, request):
+        """
+        Creates the sessions in a batch: ids are allocated in a single range,
+        speakers are looked up with a single get_multi and everything is
+        written with put_multi. The featured speaker is recomputed once.
+        """
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+
+        user_id = getUserId(user)
+        c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        conf = c_key.get()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s'
+                % request.websafeConferenceKey)
+        if user_id != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the conference organizer can create sessions.')
+        if not request.items:
+            return SessionForms(items=[])
+        if len(request.items) > MAX_BULK_SESSIONS:
+            raise endpoints.BadRequestException(
+                'At most %d sessions may be created at once.'
+                % MAX_BULK_SESSIONS)
+
+        # validate and convert all the forms before writing anything
+        forms = []
+        for form in request.items:
+            if not form.name:
+                raise endpoints.BadRequestException(
+                        "Session 'name' field required")
+            forms.append(self._sessionData(form))
+
+        # a single range of ids for all the sessions
+        first, _ = Session.allocate_ids(size=len(forms), parent=c_key)
+        sessions = []
+        speaker_forms = {}
+        for i, (data, speaker_form) in enumerate(forms):
+            data['key'] = ndb.Key(Session, first + i, parent=c_key)
+            data['conferenceId'] = c_key.id()
+            data['conferenceDisplayName'] = conf.name
+            sessions.append(Session(**data))
+            if speaker_form:
+                # the first form naming the speaker provides it's data
+                speaker_forms.setdefault(data['speakerKey'], speaker_form)
+
+        # sessions and stats belong to the conference entity group, so they
+        # are written in a single transaction
+        self._putSessions(c_key, sessions)
+
+        # then the speakers, in cross group transactions of as many speakers
+        # as allowed
+        sp_sessions = {}
+        for session in sessions:
+            if session.speakerKey:
+                sp_sessions.setdefault(session.speakerKey, []).append(
+                        session.key)
+        sp_keys = list(sp_sessions)
+        speakers = {}
+        for i in range(0, len(sp_keys), XG_MAX_ENTITY_GROUPS):
+            chunk = sp_keys[i:i + XG_MAX_ENTITY_GROUPS]
+            speakers.update(self._addSessionsToSpeakers(dict(
+                (sp_key, (sp_sessions[sp_key],
+                    self._speakerData(speaker_forms[sp_key])))\
+                for sp_key in chunk)))
+
+        # the other sessions of the speakers embed their SpeakerForm
+        formcache.invalidate([s_key.urlsafe()\
+                for speaker in speakers.values() for s_key in speaker.sessions])
+
+        spForms = dict((sp_key, self._copySpeakerToForm(speaker, ''))\
+                for sp_key, speaker in speakers.items())
+        return SessionForms(items=[
+            self._copySessionToForm(session, conf.name,
+                spForms.get(session.speakerKey))\
+            for session in sessions])
+
+
+    @ndb.transactional(xg=True)
+    def _addSessionsToSpeakers(self, speaker_sessions):
+        """
+        Append the sessions to their speakers, creating the speakers that do
+        not exist. speaker_sessions maps each speaker key to it's sessions and
+        the data of the speaker, if created. Returns the speakers by key.
+        """
+        sp_keys = list(speaker_sessions)
+        speakers = {}
+        for sp_key, sp in zip(sp_keys, ndb.get_multi(sp_keys)):
+            s_keys, data = speaker_sessions[sp_key]
+            if sp is None:
+                sp = Speaker(key=sp_key, **data)
+            sp.sessions.extend(s_key for s_key in s_keys\
+                    if s_key not in sp.sessions)
+            speakers[sp_key] = sp
+        ndb.put_multi(speakers.values())
+        return speakers
 
 
     @endpoints.method(SESSION_POST_UPDATE_REQUEST, SessionForm,
@@ -512,6 +961,7 @@ class ConferenceApi(remote.Service):
         # Not getting all the fields, so don't create a new object; just
         # copy relevant fields from SessionUpdateForm to Session object
         speaker_form = None
+        former_speaker_key = None
         for field in request.all_fields():
             #field_data = getattr(request, field.name)
             data = getattr(request, field.name)
@@ -540,24 +990,33 @@ class ConferenceApi(remote.Service):
                 # requested to be altered and create a new entity with these
                 # properties and the new ones.
                 elif field.name == 'speaker':
-                    former_speaker = getattr(session, 'speakerDisplayName')
+                    former_speaker_key = self._sessionSpeakerKey(session)
                     speaker_form = data
                     data = getattr(data, 'name')
                     # check again, as we changed data..
                     if data is not None:
                         setattr(session, 'speakerDisplayName', data)
-        session.put()
+                        setattr(session, 'speakerKey',
+                                Speaker.keyForName(data))
+        # the speaker is the one named in the form, or else the former one
+        if speaker_form and not session.speakerDisplayName:
+            raise endpoints.BadRequestException(
+                    "Speaker 'name' field required")
+        # the speaker is updated in the session transaction, so a session
+        # added to it meanwhile isn't lost
+        speaker = self._putSession(session, former_speaker_key,
+                speaker_form=speaker_form, update_speaker=True)
         spForm = None
-        if speaker_form:
-            spForm = self._updateSpeakerObject(
-                    speaker_form,
-                    conf.key.urlsafe(),
-                    former_speaker,
-                    session.key)
+        stale = [session.key.urlsafe()]
+        if speaker:
+            spForm = self._copySpeakerToForm(speaker, "")
+            # all the sessions of the speaker embed it's updated SpeakerForm
+            stale.extend(spForm.sessions)
+        formcache.invalidate(stale)
         return self._copySessionToForm(session, getattr(conf, 'name'), spForm)
 
 
-    @endpoints.method(CONF_GET_REQUEST, SessionForms,
+    @endpoints.method(CONF_GET_PAGE_REQUEST, SessionForms,
             path='conference/{websafeConferenceKey}/sessions',
             http_method='GET', name='getConferenceSessions')
     def getConferenceSessions(self, request):
@@ -570,13 +1029,22 @@ class ConferenceApi(remote.Service):
             raise endpoints.NotFoundException(
                 'No conference found with key: %s'
                  % request.websafeConferenceKey)
-        # use the conference key to query for all it's sessions and return them
-        # as a SessionForms
-        sessions = Session.query(ancestor=c_key)
+        q = Session.query(ancestor=c_key)
+        if self._summaryView(request):
+            page = self._fetchSummaryPage(q, request, SESSION_COPIER,
+                    SESSION_SUMMARY_FIELDS, conferenceDisplayName=conf.name)
+            if page:
+                return SessionForms(items=page[0], nextPageToken=page[1])
+        # use the conference key to query for a page of it's sessions and
+        # return them as a SessionForms. Only the keys are queried (or found
+        # in the query cache), as the forms are mostly found in the form cache.
+        s_keys, next_page_token = self._fetchCachedPage(q, request,
+                querycache.signature('sessions', c_key.urlsafe()),
+                keys_only=True)
         return SessionForms(
-                items=[
-                    self._copySessionToForm(session, getattr(conf, 'name'))\
-                            for session in sessions]
+                items=self._getSessionFormsAsync(
+                    s_keys, {c_key: conf.name}).get_result(),
+                nextPageToken=next_page_token
                 )
 
 
@@ -590,12 +1058,24 @@ class ConferenceApi(remote.Service):
             raise endpoints.NotFoundException(
                 'No conference found with key: %s'
                  % request.websafeConferenceKey)
-        sessions = Session.query(ancestor=conf.key).\
+        q = Session.query(ancestor=conf.key).\
                 filter(Session.typeOfSession==request.sessionType)
+        if self._summaryView(request):
+            # the type is filtered on, so it's not projected
+            page = self._fetchSummaryPage(q, request, SESSION_COPIER,
+                    SESSION_SUMMARY_FIELDS,
+                    {'typeOfSession': request.sessionType},
+                    conferenceDisplayName=conf.name)
+            if page:
+                return SessionForms(items=page[0], nextPageToken=page[1])
+        s_keys, next_page_token = self._fetchCachedPage(q, request,
+                querycache.signature('sessionsByType', conf.key.urlsafe(),
+                    request.sessionType),
+                keys_only=True)
         return SessionForms(
-                items=[
-                    self._copySessionToForm(session, getattr(conf, 'name'))\
-                    for session in sessions]
+                items=self._getSessionFormsAsync(
+                    s_keys, {conf.key: conf.name}).get_result(),
+                nextPageToken=next_page_token
                 )
 
 
@@ -606,23 +1086,30 @@ class ConferenceApi(remote.Service):
         """
         Get sessions given by the speaker specified across all conferences
         """
-        # Get speaker by name
-        speaker = ndb.Key(urlsafe=request.websafeSpeakerKey).get()
+        return self._getSessionsBySpeakerAsync(request).get_result()
+
+
+    @ndb.tasklet
+    def _getSessionsBySpeakerAsync(self, request):
+        """Tasklet implementing getSessionsBySpeaker"""
+        speaker = yield ndb.Key(urlsafe=request.websafeSpeakerKey).get_async()
         if not speaker:
             raise endpoints.NotFoundException(
                 'No speaker found with key: %s'
                  % request.websafeSpeakerKey)
-        sessions = ndb.get_multi(speaker.sessions)
-        spForm = self._copySpeakerToForm(speaker, "")
-        return SessionForms(
-                items=[
-                    self._copySessionToForm(
-                        session,
-                        session.key.parent().get().name,
-                        spForm
-                    )\
-                    for session in sessions]
-                )
+        # query the keys of the page of sessions holding the speaker key. The
+        # sessions store the name of their conference, so there are no
+        # conferences to fetch.
+        s_keys, next_page_token = yield self._fetchCachedPageAsync(
+                Session.query(Session.speakerKey==speaker.key), request,
+                querycache.signature('sessionsBySpeaker',
+                    speaker.key.urlsafe()),
+                keys_only=True)
+        forms = yield self._getSessionFormsAsync(s_keys)
+        raise ndb.Return(SessionForms(
+                items=forms,
+                nextPageToken=next_page_token
+                ))
 
 
     @endpoints.method(ConferenceQueryForms, SessionForms,
@@ -638,62 +1125,235 @@ class ConferenceApi(remote.Service):
 
         # first, we apply the regular filters
         for f in filters:
-            if f['field'] == 'date':
-                f['value'] = datetime.strptime(f['value'][:10], "%Y-%m-%d").\
-                        date()
-            elif f['field'] == 'startTime':
-                f['value'] = datetime.strptime(f['value'], "%H:%M").time()
-            query = ndb.query.FilterNode(f['field'], f['operator'], f['value'])
-            q = q.filter(query)
-
-        # The objective below was to apply at least one inequality filter using
-        # a ndb filter node, removing it from the inequality filters list
-        # (which will be applied in memory afterwards). The reasoning behind
-        # this is that ndb filter nodes are probably more efficient than
-        # recreating the lists over and over. However, the idea was abandonned
-        # because filtering by datetime.time() and datetime.date() apparently
-        # is not supported (raises a BadValueError). For now, we just apply all
-        # inequality filters with self._doInequalityFilter method. It shouldn't
-        # be as efficient, but at least it works.. This is a minor drawback and
-        # can be fixed by detecting the filter to be applied (if a
-        # datetime.time or datetime.date filter, simply ignore it and let it be
-        # applied by the _doInequalityFilter). Furthermore, this method can be
-        # further improved, considering that the DataStore limitation relates
-        # to inequality filters on different properties. Previously, we were
-        # simply checking for multiple inequality filters, with disregard of
-        # the property it was applied to.
-        '''
-        if len(inequality_filters) > 0:
-            f = inequality_filters.pop()
-            if f['field'] == 'date':
-                f['value'] = datetime.strptime(f['value'][:10], "%Y-%m-%d").\
-                        date()
-            elif f['field'] == 'startTime':
-                f['value'] = datetime.strptime(f['value'], "%H:%M").time()
-            q = q.order(ndb.GenericProperty(f['field']))
-            q = q.order(Session.name)
-            query = ndb.query.FilterNode(f['field'], f['operator'], f['value'])
-            q = q.filter(query)
-        '''
-        # creates a python list with all elements not filtered as of yet
-        s_list = [o for o in q]
-        for in_filter in inequality_filters:
-            # recreated that list over and over, until there are no more
-            # inequality filters
-            s_list = self._doInequalityFilter(in_filter, s_list)
-
-        # return a form with all sessions remaining after all filters have
-        # been applied.
+            q = q.filter(OPERATOR_FUNCS['='](
+                getattr(Session, f['field']), f['value']))
+
+        # DataStore only accepts inequality filters on a single property, which
+        # must also be the first sort order of the query. So we let the planner
+        # choose the most selective of the filtered properties and send all of
+        # it's filters along with the query. Filtering by time and date
+        # properties works as long as we go through the model properties
+        # (instead of building the ndb.query.FilterNode by hand), as they
+        # convert the values to the datastore types.
+        field, server_filters, post_filters = self._planSessionQuery(
+                inequality_filters)
+        if field:
+            prop = getattr(Session, field)
+            for f in server_filters:
+                q = q.filter(OPERATOR_FUNCS[f['operator']](prop, f['value']))
+            q = q.order(prop)
+
+        # the remaining inequality filters are applied in memory while
+        # streaming the results, until a page is filled. The keys of the page
+        # are cached under the filters, normalized so their order doesn't
+        # matter.
+        sessions, next_page_token = self._fetchCachedPage(q, request,
+                querycache.signature('querySessions',
+                    self._filtersSignature(inequality_filters + filters)),
+                post_filters)
+
+        # return a form with the sessions in the page and the token for
+        # retrieving the next one.
         return SessionForms(
-            items=[self._copySessionToForm(session, "") for session in s_list]
+            items=self._copySessionsToForms(sessions),
+            nextPageToken=next_page_token
         )
 
 
+    def _planSessionQuery(self, inequality_filters):
+        """
+        Choose the field whose inequality filters will be run by DataStore.
+        Returns the field (None if no filter can be run by DataStore), the
+        filters applied to it and the filters left to be applied in memory.
+        """
+        candidates = {}
+        for f in inequality_filters:
+            # '!=' is split in two queries by ndb, which cannot be resumed from
+            # a cursor. Besides, it's hardly selective. Always apply it later.
+            if f['operator'] != '!=':
+                candidates.setdefault(f['field'], []).append(f)
+        if not candidates:
+            return (None, [], inequality_filters)
+
+        def selectivity(field):
+            # ranges bounded on both sides ('>' and '<') come first, then we
+            # follow the order of SESSION_FIELDS_SELECTIVITY
+            bounds = set(f['operator'][0] for f in candidates[field])
+            return (-len(bounds), SESSION_FIELDS_SELECTIVITY.index(field))
+
+        field = min(candidates, key=selectivity)
+        post_filters = [f for f in inequality_filters\
+                if f['field'] != field or f['operator'] == '!=']
+        return (field, candidates[field], post_filters)
+
+
+    def _pageSize(self, request):
+        """Return the page size requested, limited to MAX_PAGE_SIZE"""
+        size = getattr(request, 'pageSize', None) or DEFAULT_PAGE_SIZE
+        return max(1, min(size, MAX_PAGE_SIZE))
+
+
+    def _pageCursor(self, request):
+        """Return the cursor encoded in the request page token, if any"""
+        token = getattr(request, 'pageToken', None)
+        if not token:
+            return None
+        try:
+            return ndb.Cursor(urlsafe=token)
+        except datastore_errors.BadValueError:
+            raise endpoints.BadRequestException(
+                    'Invalid page token: %s' % token)
+
+
+    @ndb.tasklet
+    def _fetchPageAsync(self, q, request, filters=(), keys_only=False,
+            projection=None):
+        """
+        Fetch a page of results of the query, starting at the request page
+        token. Filters are applied in memory, entities not matching all of them
+        being skipped. Returns the entities and the token for the next page
+        (None if there are no more results). Only the keys are returned if
+        keys_only is set, and only the projected properties if projection is
+        given, neither of which is possible along with filters.
+        """
+        size = self._pageSize(request)
+        cursor = self._pageCursor(request)
+        if not filters:
+            options = {'keys_only': keys_only}
+            if projection:
+                options['projection'] = projection
+            items, cursor, more = yield q.fetch_page_async(
+                    size, start_cursor=cursor, **options)
+            raise ndb.Return((items, cursor.urlsafe() if more and cursor\
+                    else None))
+
+        items = []
+        scanned = 0
+        it = q.iter(start_cursor=cursor, produce_cursors=True, batch_size=size)
+        while (yield it.has_next_async()):
+            entity = it.next()
+            scanned += 1
+            if all(self._matchesFilter(f, entity) for f in filters):
+                items.append(entity)
+            if len(items) == size or scanned == MAX_SCANNED_PER_PAGE:
+                cursor = it.cursor_after()
+                if (yield it.has_next_async()):
+                    raise ndb.Return((items, cursor.urlsafe()))
+                break
+        raise ndb.Return((items, None))
+
+
+    def _fetchPage(self, q, request, filters=(), keys_only=False,
+            projection=None):
+        """Synchronous version of _fetchPageAsync"""
+        return self._fetchPageAsync(q, request, filters,
+                keys_only, projection).get_result()
+
+
+    @ndb.tasklet
+    def _fetchCachedPageAsync(self, q, request, signature, filters=(),
+            keys_only=False):
+        """
+        Same as _fetchPageAsync, except the keys of the page (and the token for
+        the next one) are cached by querycache under the signature of the
+        query, and the entities are then got by key. The signature must
+        identify the query, filters applied in memory included.
+        """
+        kind = q.kind
+        size = self._pageSize(request)
+        token = getattr(request, 'pageToken', None)
+        page, generation = yield querycache.getAsync(
+                kind, signature, size, token)
+        entities = None
+        if page is not None:
+            keys, next_page_token = page
+        elif filters:
+            entities, next_page_token = yield self._fetchPageAsync(
+                    q, request, filters)
+            keys = [entity.key for entity in entities]
+        else:
+            keys, next_page_token = yield self._fetchPageAsync(
+                    q, request, keys_only=True)
+        if page is None:
+            yield querycache.setAsync(kind, generation, signature, size, token,
+                    keys, next_page_token)
+        if keys_only:
+            raise ndb.Return((keys, next_page_token))
+        if entities is None:
+            # served by the context cache or memcache when possible
+            entities = yield ndb.get_multi_async(keys)
+            entities = [entity for entity in entities if entity]
+        raise ndb.Return((entities, next_page_token))
+
+
+    def _fetchCachedPage(self, q, request, signature, filters=(),
+            keys_only=False):
+        """Synchronous version of _fetchCachedPageAsync"""
+        return self._fetchCachedPageAsync(q, request, signature, filters,
+                keys_only).get_result()
+
+
+    def _filtersSignature(self, filters):
+        """
+        Return the formatted filters as a tuple of (field, operator, value),
+        in a stable order, for the query signatures.
+        """
+        return tuple(sorted((f['field'], f['operator'], f['value'])\
+                for f in filters))
+
+
+    def _summaryView(self, request):
+        """Return whether the request asks for the SUMMARY view"""
+        view = getattr(request, 'view', None) or 'FULL'
+        if view not in VIEWS:
+            raise endpoints.BadRequestException(
+                    "Invalid view '%s', expected one of %s" % (
+                        view, ', '.join(VIEWS)))
+        return view == 'SUMMARY'
+
+
+    @ndb.tasklet
+    def _fetchSummaryPageAsync(self, q, request, copier, fields, fixed=None,
+            **extra):
+        """
+        Fetch a page of the query projected on the summary fields and copy it
+        to forms. Properties filtered by equality cannot be projected, so their
+        values are taken from fixed (mapping them to the value filtered on).
+        Extra fields are set on every form. Returns the forms and the token
+        for the next page, or None if there is no index for the projection
+        query, in which case the FULL view has to be used instead.
+        """
+        fixed = fixed or {}
+        projection = [field for field in fields if field not in fixed]
+        try:
+            entities, next_page_token = yield self._fetchPageAsync(
+                    q, request, projection=projection)
+        except datastore_errors.NeedIndexError:
+            raise ndb.Return(None)
+        copier = copier.restrict(projection)
+        forms = []
+        for entity in entities:
+            form = copier.copy(entity, **extra)
+            for field, value in fixed.items():
+                if field in fields:
+                    setattr(form, field, value)
+            forms.append(form)
+        raise ndb.Return((forms, next_page_token))
+
+
+    def _fetchSummaryPage(self, q, request, copier, fields, fixed=None,
+            **extra):
+        """Synchronous version of _fetchSummaryPageAsync"""
+        return self._fetchSummaryPageAsync(q, request, copier, fields, fixed,
+                **extra).get_result()
+
+
     def _formatAllFilters(self, filters):
         """
             Same as the original self._formatFilter, except it aggregates all
             inequality filters in a list and does not raise an exception in case
-            there is more than one inequality filter
+            there is more than one inequality filter. Values are converted to
+            the type of the session property.
         """
         formatted_filters = []
         formatted_inequality_filters = []
@@ -706,6 +1366,8 @@ class ConferenceApi(remote.Service):
             except KeyError:
                 raise endpoints.BadRequestException(
                         "Filter contains invalid field or operator.")
+            filtr["value"] = self._parseSessionFilterValue(
+                    filtr["field"], filtr["value"])
             if filtr["operator"] != "=":
                 formatted_inequality_filters.append(filtr)
             else:
@@ -713,34 +1375,34 @@ class ConferenceApi(remote.Service):
         return (formatted_inequality_filters, formatted_filters)
 
 
-    def _doInequalityFilter(self, f, query):
-        """
-        Applies inequality filters on memory objects received from a query.
-        Ignores objects which the value of the field to be filtered on is None.
-        """
-        if f['field'] == 'date':
-            f['value'] = datetime.strptime(f['value'][:10], "%Y-%m-%d").\
-                date()
-        elif f['field'] == 'startTime':
-            f['value'] = datetime.strptime(f['value'], "%H:%M").time()
-
-        op = f['operator']
-        ref_value = f['value']
-        ftr_lst = []
-        for obj in query:
-            obj_value = getattr(obj, f['field'])
-            if obj_value:
-                if op == '!=' and obj_value != ref_value:
-                    ftr_lst.append(obj)
-                elif op == '>' and obj_value > ref_value:
-                    ftr_lst.append(obj)
-                elif op == '>=' and obj_value >= ref_value:
-                    ftr_lst.append(obj)
-                elif op == '<' and obj_value < ref_value:
-                    ftr_lst.append(obj)
-                elif op == '<=' and obj_value <= ref_value:
-                    ftr_lst.append(obj)
-        return ftr_lst
+    def _parseSessionFilterValue(self, field, value):
+        """Convert a filter value to the type of the session property"""
+        try:
+            if field == 'date':
+                return datetime.strptime(value[:10], "%Y-%m-%d").date()
+            elif field == 'startTime':
+                return datetime.strptime(value, "%H:%M").time()
+            elif field == 'duration':
+                return int(value)
+        except (TypeError, ValueError):
+            raise endpoints.BadRequestException(
+                    "Filter contains invalid value for field '%s'." % field)
+        return value
+
+
+    def _matchesFilter(self, f, obj):
+        """
+        Applies an inequality filter on a memory object received from a query.
+        Objects which the value of the field to be filtered on is None never
+        match. Repeated properties match if any of their values does, as they
+        would in a DataStore query.
+        """
+        obj_value = getattr(obj, f['field'])
+        if not isinstance(obj_value, list):
+            obj_value = [obj_value]
+        op = OPERATOR_FUNCS[f['operator']]
+        return any(op(value, f['value']) for value in obj_value\
+                if value is not None)
 
 
 # - - - Session wishlist - - - - - - - - - - - - - - - - - -
@@ -750,24 +1412,7 @@ class ConferenceApi(remote.Service):
             http_method='DELETE', name='deleteSessionInWishlist')
     def deleteSessionInWishlist(self, request):
         """Deletes session from authorized user wishlist"""
-        prof = self._getProfileFromUser() # get user Profile
-        session = ndb.Key(urlsafe=request.websafeSessionKey).get()
-        if not session:
-            raise endpoints.NotFoundException(
-                'No session found with key: %s' % request.websafeSessionKey)
-        if request.websafeSessionKey not in getattr(prof, 'sessionWishlist'):
-            raise ConflictException(
-                "You do not have this session in your wishlist")
-        prof.sessionWishlist.remove(request.websafeSessionKey)
-        prof.put()
-        sessionKeys = [ndb.Key(urlsafe=websafeSessionKey) for websafeSessionKey
-                in getattr(prof, 'sessionWishlist')]
-        sessions = ndb.get_multi(sessionKeys)
-        return SessionForms(
-                items=[
-                    self._copySessionToForm(session, '')\
-                    for session in sessions]
-                )
+        return self._mutateWishlist(request, add=False)
 
 
     @endpoints.method(ADD_SESSION_POST_REQUEST, SessionForms,
@@ -775,63 +1420,134 @@ class ConferenceApi(remote.Service):
             http_method='PUT', name='addSessionToWishlist')
     def addSessionToWishlist(self, request):
         """Adds a session to the authorized user session wishlist"""
-        prof = self._getProfileFromUser() # get user Profile
+        return self._mutateWishlist(request, add=True)
+
+
+    def _mutateWishlist(self, request, add):
+        """
+        Add or remove a session from the authorized user wishlist. Returns the
+        first page of the wishlist or, if the request is lightweight, only the
+        session added or removed. Either way, the etag of the updated wishlist
+        is returned along.
+        """
+        p_key = self._getProfileFromUser().key # get user Profile
 
         # check if the session exists given websafeSessionKey
         session = ndb.Key(urlsafe=request.websafeSessionKey).get()
         if not session:
             raise endpoints.NotFoundException(
                 'No session found with key: %s' % request.websafeSessionKey)
-        if request.websafeSessionKey in getattr(prof, 'sessionWishlist'):
-            raise ConflictException(
-                "You have already added this session to your wishlist")
-        prof.sessionWishlist.append(request.websafeSessionKey)
-        prof.put()
-        sessionKeys = [ndb.Key(urlsafe=websafeSessionKey) for websafeSessionKey
-                in getattr(prof, 'sessionWishlist')]
-        sessions = ndb.get_multi(sessionKeys)
-        return SessionForms(
-                items=[
-                    self._copySessionToForm(session, '')\
-                    for session in sessions]
-                )
+        etag = self._updateWishlist(p_key, session.key, add)
+        if request.lightweight:
+            return SessionForms(
+                    items=self._copySessionsToForms([session]), etag=etag)
+        forms = self._getWishlistPageAsync(p_key, request).get_result()
+        forms.etag = etag
+        return forms
 
 
-    @endpoints.method(message_types.VoidMessage, SessionForms,
+    @unitofwork.transactional()
+    def _updateWishlist(self, p_key, session_key, add):
+        """
+        Add or remove the session from the wishlist of the profile, bumping
+        the wishlist version. Returns the new wishlist etag.
+        """
+        # wishlist entries are keyed by the session websafe key, so there is
+        # no need to go through the whole wishlist
+        entry_key = ndb.Key(WishlistEntry, session_key.urlsafe(), parent=p_key)
+        prof, entry = ndb.get_multi([p_key, entry_key])
+        if add:
+            if entry:
+                raise ConflictException(
+                    "You have already added this session to your wishlist")
+            entry = WishlistEntry(key=entry_key, session=session_key)
+        else:
+            if not entry:
+                raise ConflictException(
+                    "You do not have this session in your wishlist")
+            unitofwork.delete(entry_key)
+        prof.wishlistVersion += 1
+        # written (and deleted) when the transaction's unit of work ends
+        unitofwork.add(*([prof, entry] if add else [prof]))
+        return str(prof.wishlistVersion)
+
+
+    @endpoints.method(WISHLIST_GET_REQUEST, SessionForms,
             path='profile/sessions',
             http_method='GET', name='getSessionWishlist')
     def getSessionWishlist(self, request):
-        """ Get the authorized user session wishlist """
-        prof = self._getProfileFromUser() # get user Profile
-        sessionKeys = [ndb.Key(urlsafe=websafeSessionKey) for websafeSessionKey
-                in getattr(prof, 'sessionWishlist')]
-        sessions = ndb.get_multi(sessionKeys)
-        return SessionForms(
-                items=[
-                    self._copySessionToForm(session, '')\
-                    for session in sessions]
-                )
+        """
+        Get the authorized user session wishlist. If the etag sent matches
+        the current one, the wishlist is not returned, only notModified.
+        """
+        return self._getSessionWishlistAsync(request).get_result()
+
+
+    @ndb.tasklet
+    def _getSessionWishlistAsync(self, request):
+        """Tasklet implementing getSessionWishlist"""
+        p_key = self._getProfileKeyFromUser()
+        prof = yield p_key.get_async()
+        etag = str(getattr(prof, 'wishlistVersion', 0))
+        # the etag stands for the whole wishlist, so it's only checked when
+        # the first page is requested
+        if request.etag == etag and not request.pageToken:
+            raise ndb.Return(SessionForms(etag=etag, notModified=True))
+
+        # the session keys of the pages are cached by wishlist version, so
+        # they never have to be invalidated. The forms themselves come from
+        # the form cache, which is invalidated when the sessions change.
+        ctx = ndb.get_context()
+        cache_key = MEMCACHE_WISHLIST_KEY % (p_key.id(), etag,
+                self._pageSize(request), request.pageToken or '')
+        cached = yield ctx.memcache_get(cache_key)
+        if cached:
+            websafeKeys, next_page_token = cached
+            s_keys = [ndb.Key(urlsafe=wssk) for wssk in websafeKeys]
+        else:
+            s_keys, next_page_token = yield self._getWishlistKeysAsync(
+                    p_key, request)
+            yield ctx.memcache_set(cache_key,
+                    ([s_key.urlsafe() for s_key in s_keys], next_page_token),
+                    time=WISHLIST_CACHE_TIME)
+        forms = yield self._getSessionFormsAsync(s_keys)
+        raise ndb.Return(SessionForms(
+            items=forms, nextPageToken=next_page_token, etag=etag))
+
+
+    @ndb.tasklet
+    def _getWishlistKeysAsync(self, p_key, request):
+        """
+        Tasklet returning the session keys of a page of the wishlist of the
+        given profile, and the token of the next page
+        """
+        entries, next_page_token = yield self._fetchPageAsync(
+                WishlistEntry.query(ancestor=p_key).order(
+                    WishlistEntry.created),
+                request)
+        raise ndb.Return(
+                ([entry.session for entry in entries], next_page_token))
+
+
+    @ndb.tasklet
+    def _getWishlistPageAsync(self, p_key, request):
+        """Tasklet returning a page of the wishlist of the given profile"""
+        s_keys, next_page_token = yield self._getWishlistKeysAsync(
+                p_key, request)
+        forms = yield self._getSessionFormsAsync(s_keys)
+        raise ndb.Return(SessionForms(
+            items=forms, nextPageToken=next_page_token))
 
 
 # - - - Conference objects - - - - - - - - - - - - - - - - -
 
 
-    def _copyConferenceToForm(self, conf, displayName):
+    @perf.timed
+    def _copyConferenceToForm(self, conf, displayName=None):
         """Copy relevant fields from Conference to ConferenceForm."""
-        cf = ConferenceForm()
-        for field in cf.all_fields():
-            if hasattr(conf, field.name):
-                # convert Date to date string; just copy others
-                if field.name.endswith('Date'):
-                    setattr(cf, field.name, str(getattr(conf, field.name)))
-                else:
-                    setattr(cf, field.name, getattr(conf, field.name))
-            elif field.name == "websafeKey":
-                setattr(cf, field.name, conf.key.urlsafe())
-        if displayName:
-            setattr(cf, 'organizerDisplayName', displayName)
-        cf.check_initialized()
-        return cf
+        # dates are converted to string by the copier. The organizer name is
+        # stored in the conference, unless overridden by displayName.
+        return CONFERENCE_COPIER.copy(conf, organizerDisplayName=displayName)
 
 
     def _createConferenceObject(self, request):
@@ -874,39 +1590,59 @@ class ConferenceApi(remote.Service):
         # set seatsAvailable to be same as maxAttendees on creation
         if data["maxAttendees"] > 0:
             data["seatsAvailable"] = data["maxAttendees"]
-        # generate Profile Key based on user ID and Conference
-        # ID based on Profile key get Conference key from ID
+        # generate Profile Key based on user ID. The Conference is a child of
+        # the Profile. It's id is allocated beforehand, so the conference and
+        # it's seat shards are written at once.
         p_key = ndb.Key(Profile, user_id)
         c_id = Conference.allocate_ids(size=1, parent=p_key)[0]
         c_key = ndb.Key(Conference, c_id, parent=p_key)
         data['key'] = c_key
         data['organizerUserId'] = request.organizerUserId = user_id
 
+        # the organizer display name is kept in the conference, so listings
+        # don't need to look up the profile
+        data['organizerDisplayName'] = getattr(p_key.get(), 'displayName', '')
+
         # create Conference, send email to organizer confirming
         # creation of Conference & return (modified) ConferenceForm
-        Conference(**data).put()
+        conf = Conference(**data)
+        unitofwork.add(conf)
+        seats.initSeats(c_key, data['seatsAvailable'])
         taskqueue.add(params={'email': user.email(),
             'conferenceInfo': repr(request)},
             url='/tasks/send_confirmation_email'
         )
-        prof = p_key.get()
-        try:
-            return self._copyConferenceToForm(c_key.get(), getattr(prof, 'displayName'))
-        except AttributeError:
-            return self._copyConferenceToForm(c_key.get(), '')
+        # the form is built from the conference just written, instead of
+        # reading it back
+        return self._copyConferenceToForm(conf)
 
 
-    @ndb.transactional()
     def _updateConferenceObject(self, request):
+        # the user is looked up before the transaction, so retries of the
+        # transaction don't repeat it
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
         user_id = getUserId(user)
 
-        # copy ConferenceForm/ProtoRPC Message into dict
-        data = {field.name: getattr(request, field.name)\
-                for field in request.all_fields()}
+        perf.count('updateConference.transactions')
+        try:
+            conf = self._updateConference(request, user_id)
+        except datastore_errors.TransactionFailedError:
+            perf.count('updateConference.failed')
+            raise ConflictException(
+                'The conference is being updated by someone else, retry.')
+        return self._copyConferenceToForm(conf)
 
+
+    @unitofwork.transactional()
+    @perf.counted('updateConference.attempts')
+    def _updateConference(self, request, user_id):
+        """
+        Transactional core of updateConference, only touching the conference
+        (and the record of the request id, if given). A request id already
+        applied returns the conference as is.
+        """
         # update existing conference
         conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
         # check that conference exists
@@ -920,9 +1656,21 @@ class ConferenceApi(remote.Service):
             raise endpoints.ForbiddenException(
                 'Only the owner can update the conference.')
 
+        # a retry of a request already applied
+        if request.requestId:
+            pr_key = ndb.Key(ProcessedRequest, request.requestId,
+                    parent=conf.key)
+            if pr_key.get():
+                perf.count('updateConference.replayed')
+                return conf
+            unitofwork.add(ProcessedRequest(key=pr_key, result=True))
+
         # Not getting all the fields, so don't create a new object; just
         # copy relevant fields from ConferenceForm to Conference object
+        announce = False
         for field in request.all_fields():
+            if field.name in ('websafeConferenceKey', 'requestId'):
+                continue
             data = getattr(request, field.name)
             # only copy fields where we get data
             if data not in (None, []):
@@ -933,9 +1681,26 @@ class ConferenceApi(remote.Service):
                         conf.month = data.month
                 # write to Conference object
                 setattr(conf, field.name, data)
-        conf.put()
-        prof = ndb.Key(Profile, user_id).get()
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+                # seats are taken from the shards, so these have to be reset
+                if field.name == 'seatsAvailable':
+                    seats.resetSeats(conf.key, data)
+                # the nearly sold out conferences show the name and depend on
+                # the seats available
+                if field.name in ('seatsAvailable', 'name'):
+                    announce = True
+                # the name is copied to the conference sessions, which are
+                # updated in the background once the conference is saved
+                if field.name == 'name':
+                    self._queueConferenceNameUpdate(
+                            conf.key.urlsafe(), transactional=True)
+        unitofwork.add(conf)
+        # dropped from the form cache once the transaction commits
+        formcache.invalidate([conf.key.urlsafe()])
+        if announce:
+            ndb.get_context().call_on_commit(
+                    lambda: announcements.seatsChanged(conf.key, conf.name,
+                        seats.seatsAvailableAsync(conf).get_result()))
+        return conf
 
 
     @endpoints.method(ConferenceForm, ConferenceForm, path='conference',
@@ -945,6 +1710,58 @@ class ConferenceApi(remote.Service):
         return self._createConferenceObject(request)
 
 
+    @staticmethod
+    def _queueConferenceNameUpdate(websafeConferenceKey, websafeCursor=None,
+            transactional=False):
+        """Queue the update of the conference name of it's sessions"""
+        params = {'websafeConferenceKey': websafeConferenceKey}
+        if websafeCursor:
+            params['cursor'] = websafeCursor
+        taskqueue.add(params=params, url='/tasks/update_conference_name',
+                transactional=transactional)
+
+
+    @staticmethod
+    def _updateConferenceName(websafeConferenceKey, websafeCursor=None):
+        """
+        Copy the name of the conference to a batch of it's sessions. Returns
+        the cursor for the next batch, or None once all have been updated.
+        The name is read from the conference on every batch, so if it changes
+        again midway the latest one wins.
+        """
+        c_key = ndb.Key(urlsafe=websafeConferenceKey)
+        if not c_key.get():
+            return None
+        cursor = ndb.Cursor(urlsafe=websafeCursor) if websafeCursor else None
+        keys, cursor, more = Session.query(ancestor=c_key).fetch_page(
+                MIGRATION_BATCH_SIZE, start_cursor=cursor, keys_only=True)
+        # the sessions are children of the conference, so the batch is
+        # updated in a single transaction (see _copyNameToChildren)
+        changed = ConferenceApi._copyNameToChildren(c_key, 'name', keys,
+                'conferenceDisplayName')
+        formcache.invalidate([key.urlsafe() for key in changed])
+        return cursor.urlsafe() if more and cursor else None
+
+
+    @staticmethod
+    def _backfillSessionConferenceNames(websafeCursor=None):
+        """
+        Set the conference name of a batch of the sessions created before it
+        was stored in the session. Returns the cursor for the next batch, or
+        None once all sessions have been visited.
+        """
+        cursor = ndb.Cursor(urlsafe=websafeCursor) if websafeCursor else None
+        sessions, cursor, more = Session.query().fetch_page(
+                MIGRATION_BATCH_SIZE, start_cursor=cursor)
+        # only the sessions missing the name are got again and put, in a
+        # transaction per conference
+        changed = ConferenceApi._copyNameToGroups([s.key for s in sessions\
+                if s.conferenceDisplayName is None], 'name',
+                'conferenceDisplayName', only_missing=True)
+        formcache.invalidate([key.urlsafe() for key in changed])
+        return cursor.urlsafe() if more and cursor else None
+
+
     @endpoints.method(CONF_POST_UPDATE_REQUEST, ConferenceForm,
             path='conference/{websafeConferenceKey}',
             http_method='PUT', name='updateConference')
@@ -958,21 +1775,34 @@ class ConferenceApi(remote.Service):
             http_method='GET', name='getConference')
     def getConference(self, request):
         """Return requested conference (by websafeConferenceKey)."""
+        return self._getConferenceAsync(request).get_result()
+
+
+    @ndb.tasklet
+    def _getConferenceAsync(self, request):
+        """Tasklet implementing getConference"""
         # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        forms, versions = yield formcache.getAsync(
+                ConferenceForm, [c_key.urlsafe()])
+        if forms[0]:
+            raise ndb.Return(forms[0])
+        conf = yield c_key.get_async()
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s'
                 % request.websafeConferenceKey)
-        prof = conf.key.parent().get()
-        # return ConferenceForm
-        try:
-            return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
-        except AttributeError:
-            return self._copyConferenceToForm(conf, '')
+        # Conference.seatsAvailable is only synced with the seat shards every
+        # few seconds, so we show the up to date total.
+        conf.seatsAvailable = yield seats.seatsAvailableAsync(conf)
+        # cache and return ConferenceForm
+        form = self._copyConferenceToForm(conf)
+        yield formcache.setAsync(ConferenceForm, [c_key.urlsafe()], versions,
+                [form])
+        raise ndb.Return(form)
 
 
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    @endpoints.method(VIEW_PAGE_REQUEST, ConferenceForms,
             path='getConferencesCreated',
             http_method='POST', name='getConferencesCreated')
     def getConferencesCreated(self, request):
@@ -984,20 +1814,26 @@ class ConferenceApi(remote.Service):
         user_id = getUserId(user)
 
         # create ancestor query for all key matches for this user
-        confs = Conference.query(ancestor=ndb.Key(Profile, user_id))
-        prof = ndb.Key(Profile, user_id).get()
+        q = Conference.query(ancestor=ndb.Key(Profile, user_id))
+        if self._summaryView(request):
+            page = self._fetchSummaryPage(q, request, CONFERENCE_COPIER,
+                    CONFERENCE_SUMMARY_FIELDS)
+            if page:
+                return ConferenceForms(items=page[0], nextPageToken=page[1])
+        confs, next_page_token = self._fetchCachedPage(q, request,
+                querycache.signature('conferencesCreated', user_id))
         # return set of ConferenceForm objects per Conference
         return ConferenceForms(
-            items=[
-                self._copyConferenceToForm(conf, getattr(prof, 'displayName'))\
-                        for conf in confs]
+            items=[self._copyConferenceToForm(conf) for conf in confs],
+            nextPageToken=next_page_token
         )
 
 
     def _getQuery(self, request):
         """Return formatted query from the submitted filters."""
         q = Conference.query()
-        inequality_filter, filters = self._formatFilters(request.filters)
+        inequality_filter, filters = self._formatConferenceFilters(
+                request.filters)
 
         # If exists, sort on inequality filter first
         if not inequality_filter:
@@ -1005,16 +1841,45 @@ class ConferenceApi(remote.Service):
         else:
             q = q.order(ndb.GenericProperty(inequality_filter))
             q = q.order(Conference.name)
+        # a != filter is run as several queries merged together, which can
+        # only be paged with cursors when ordered by key last. Every index
+        # ends with the key anyway, so no new index is needed.
+        q = q.order(Conference.key)
 
         for filtr in filters:
-            if filtr["field"] in ["month", "maxAttendees"]:
-                filtr["value"] = int(filtr["value"])
             formatted_query = ndb.query.FilterNode(
                     filtr["field"], filtr["operator"], filtr["value"])
             q = q.filter(formatted_query)
         return q
 
 
+    def _formatConferenceFilters(self, filters):
+        """
+        Same as _formatFilters, with the values converted to the type of the
+        conference property.
+        """
+        inequality_filter, filters = self._formatFilters(filters)
+        for filtr in filters:
+            if filtr["field"] in ["month", "maxAttendees"]:
+                try:
+                    filtr["value"] = int(filtr["value"])
+                except (TypeError, ValueError):
+                    raise endpoints.BadRequestException(
+                        "Filter contains invalid value for field '%s'."\
+                                % filtr["field"])
+        return (inequality_filter, filters)
+
+
+    def _equalityValues(self, filters):
+        """
+        Return the values of the conference properties filtered by equality,
+        converted as in the query.
+        """
+        return dict((filtr["field"], filtr["value"])\
+                for filtr in self._formatConferenceFilters(filters)[1]\
+                if filtr["operator"] == "=")
+
+
     def _formatFilters(self, filters):
         """Parse, check validity and format user supplied filters."""
         formatted_filters = []
@@ -1053,51 +1918,71 @@ class ConferenceApi(remote.Service):
             name='queryConferences')
     def queryConferences(self, request):
         """Query for conferences."""
-        conferences = self._getQuery(request)
-
-        # need to fetch organiser displayName from profiles
-        # get all keys and use get_multi for speed
-        organisers = [(ndb.Key(Profile, conf.organizerUserId))\
-                for conf in conferences]
-        profiles = ndb.get_multi(organisers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        return self._queryConferencesAsync(request).get_result()
+
+
+    @ndb.tasklet
+    def _queryConferencesAsync(self, request):
+        """Tasklet implementing queryConferences"""
+        q = self._getQuery(request)
+        if self._summaryView(request):
+            page = yield self._fetchSummaryPageAsync(q, request,
+                    CONFERENCE_COPIER, CONFERENCE_SUMMARY_FIELDS,
+                    self._equalityValues(request.filters))
+            if page:
+                raise ndb.Return(ConferenceForms(
+                    items=page[0], nextPageToken=page[1]))
+        # the keys of the page are cached under the filters, normalized so
+        # their order (and the spelling of the numbers) doesn't matter
+        conferences, next_page_token = yield self._fetchCachedPageAsync(
+                q, request, querycache.signature('queryConferences',
+                    self._filtersSignature(
+                        self._formatConferenceFilters(request.filters)[1])))
+
+        # the organiser displayName is stored in the conferences, so there
+        # are no profiles to fetch
+        forms = [self._copyConferenceToForm(conf) for conf in conferences]
 
         # return individual ConferenceForm object per Conference
-        return ConferenceForms(
-                items=[
-                    self._copyConferenceToForm(
-                        conf,
-                        names[conf.organizerUserId])\
-                    for conf in conferences]
-        )
+        raise ndb.Return(ConferenceForms(
+            items=forms, nextPageToken=next_page_token))
 
 
 
 # - - - Profile objects - - - - - - - - - - - - - - - - - - -
 
+    @perf.timed
     def _copyProfileToForm(self, prof):
         """Copy relevant fields from Profile to ProfileForm."""
-        # copy relevant fields from Profile to ProfileForm
-        pf = ProfileForm()
-        for field in pf.all_fields():
-            if hasattr(prof, field.name):
-                # convert t-shirt string to Enum; just copy others
-                if field.name == 'teeShirtSize':
-                    setattr(pf, field.name, getattr(
-                        TeeShirtSize, getattr(prof, field.name)))
-                else:
-                    setattr(pf, field.name, getattr(prof, field.name))
-        pf.check_initialized()
-        return pf
+        # the t-shirt string is converted to Enum by the copier
+        return PROFILE_COPIER.copy(prof)
 
 
-    def _getProfileFromUser(self):
+    def _getProfileFromUser(self, deferred=False):
         """Return user Profile from datastore, creating new one if
         non-existent."""
+        return self._getProfileFromUserAsync(deferred).get_result()
+
+
+    def _getProfileKeyFromUser(self):
+        """
+        Return the key of the user Profile. Used when reading the children of
+        the profile, which doesn't require the profile itself.
+        """
+        # make sure user is authed
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        return ndb.Key(Profile, getUserId(user))
+
+
+    @ndb.tasklet
+    def _getProfileFromUserAsync(self, deferred=False):
+        """
+        Tasklet version of _getProfileFromUser. A new profile is written right
+        away, as the transactions of the request read it, unless deferred is
+        set (by callers writing it themselves, which then only write it once).
+        """
         # make sure user is authed
         user = endpoints.get_current_user()
         if not user:
@@ -1106,7 +1991,7 @@ class ConferenceApi(remote.Service):
         # get Profile from datastore
         user_id = getUserId(user)
         p_key = ndb.Key(Profile, user_id)
-        profile = p_key.get()
+        profile = yield p_key.get_async()
         # create new Profile if not there
         if not profile:
             profile = Profile(
@@ -1115,15 +2000,20 @@ class ConferenceApi(remote.Service):
                 mainEmail= user.email(),
                 teeShirtSize = str(TeeShirtSize.NOT_SPECIFIED),
             )
-            profile.put()
+            # written along with the other entities of the request
+            if deferred and unitofwork.active():
+                unitofwork.add(profile)
+            else:
+                yield profile.put_async()
 
-        return profile      # return Profile
+        raise ndb.Return(profile)      # return Profile
 
 
     def _doProfile(self, save_request=None):
         """Get user Profile and return to user, possibly updating it first."""
-        # get user Profile
-        prof = self._getProfileFromUser()
+        # get user Profile; a new one is written along with the changes
+        prof = self._getProfileFromUser(deferred=True)
+        former_name = prof.displayName
 
         # if saveProfile(), process user-modifyable fields
         if save_request:
@@ -1136,10 +2026,156 @@ class ConferenceApi(remote.Service):
                         #    setattr(prof, field, str(val).upper())
                         #else:
                         #    setattr(prof, field, val)
-                        prof.put()
+                        # written once, when the request ends
+                        unitofwork.add(prof)
+            # the display name is copied to the conferences of the user, which
+            # are updated in the background, once the profile is written
+            if prof.displayName != former_name:
+                unitofwork.afterFlush(
+                    lambda: self._queueOrganizerNameUpdate(prof.key.id()))
+
+        # the registrations and wishlist are children of the profile, so we
+        # fetch their keys (which are the websafe keys of the conferences and
+        # sessions) with ancestor queries
+        registrations = Registration.query(ancestor=prof.key).fetch_async(
+                keys_only=True)
+        wishlist = WishlistEntry.query(ancestor=prof.key).fetch_async(
+                keys_only=True)
 
         # return ProfileForm
-        return self._copyProfileToForm(prof)
+        pf = self._copyProfileToForm(prof)
+        pf.conferenceKeysToAttend = [key.id()\
+                for key in registrations.get_result()]
+        pf.sessionWishlist = [key.id() for key in wishlist.get_result()]
+        return pf
+
+
+    @staticmethod
+    def _queueOrganizerNameUpdate(user_id, websafeCursor=None):
+        """Queue the update of the organizer name of the user conferences"""
+        params = {'userId': user_id}
+        if websafeCursor:
+            params['cursor'] = websafeCursor
+        taskqueue.add(params=params, url='/tasks/update_organizer_name')
+
+
+    @staticmethod
+    @ndb.transactional()
+    def _copyNameToChildren(parent_key, name_field, keys, field,
+            only_missing=False, put_all=False):
+        """
+        Copy the name (name_field) of the parent entity to the field of the
+        given children. The children are got again and put in a transaction
+        (they are all in the entity group of the parent), so a concurrent
+        update of any of them isn't overwritten. Only the children without a
+        name are set if only_missing, and the unchanged ones are put too if
+        put_all. Returns the keys of the children put.
+        """
+        entities = ndb.get_multi([parent_key] + keys)
+        parent, children = entities[0], [c for c in entities[1:] if c]
+        name = getattr(parent, name_field) if parent else ''
+        changed = [c for c in children if getattr(c, field) is None\
+                or (not only_missing and getattr(c, field) != name)]
+        for child in changed:
+            setattr(child, field, name)
+        if put_all:
+            changed = children
+        ndb.put_multi(changed)
+        return [child.key for child in changed]
+
+
+    @staticmethod
+    def _copyNameToGroups(keys, name_field, field, only_missing=False,
+            put_all=False):
+        """
+        Same as _copyNameToChildren, for children of several parents: one
+        transaction per entity group. Returns the keys of the children put.
+        """
+        groups = {}
+        for key in keys:
+            groups.setdefault(key.parent(), []).append(key)
+        changed = []
+        for parent_key, children in groups.items():
+            changed += ConferenceApi._copyNameToChildren(parent_key,
+                    name_field, children, field, only_missing, put_all)
+        return changed
+
+
+    @staticmethod
+    def _updateOrganizerName(user_id, websafeCursor=None):
+        """
+        Copy the display name of the user to a batch of it's conferences.
+        Returns the cursor for the next batch, or None once all have been
+        updated. The name is read from the profile on every batch, so if it
+        changes again midway the latest one wins.
+        """
+        p_key = ndb.Key(Profile, user_id)
+        if not p_key.get():
+            return None
+        cursor = ndb.Cursor(urlsafe=websafeCursor) if websafeCursor else None
+        keys, cursor, more = Conference.query(ancestor=p_key).fetch_page(
+                MIGRATION_BATCH_SIZE, start_cursor=cursor, keys_only=True)
+        # the conferences are children of the profile, so the batch is
+        # updated in a single transaction
+        changed = ConferenceApi._copyNameToChildren(p_key, 'displayName',
+                keys, 'organizerDisplayName')
+        formcache.invalidate([key.urlsafe() for key in changed])
+        return cursor.urlsafe() if more and cursor else None
+
+
+    @staticmethod
+    def _backfillOrganizerNames(websafeCursor=None):
+        """
+        Set the organizer name of a batch of the conferences created before
+        it was stored in the conference. Every conference visited is put
+        again, so the ones stored while the name wasn't indexed get their
+        index rows (the summary views don't return conferences without
+        them). Returns the cursor for the next batch, or None once all
+        conferences have been visited.
+        """
+        cursor = ndb.Cursor(urlsafe=websafeCursor) if websafeCursor else None
+        keys, cursor, more = Conference.query().fetch_page(
+                MIGRATION_BATCH_SIZE, start_cursor=cursor, keys_only=True)
+        changed = ConferenceApi._copyNameToGroups(keys, 'displayName',
+                'organizerDisplayName', only_missing=True, put_all=True)
+        formcache.invalidate([key.urlsafe() for key in changed])
+        return cursor.urlsafe() if more and cursor else None
+
+
+    @staticmethod
+    def _migrateProfiles(websafeCursor=None):
+        """
+        Move the conference registrations and session wishlist of a batch of
+        profiles to Registration and WishlistEntry entities. Returns the cursor
+        for the next batch, or None once all profiles have been visited.
+        """
+        cursor = ndb.Cursor(urlsafe=websafeCursor) if websafeCursor else None
+        profiles, cursor, more = Profile.query().fetch_page(
+                MIGRATION_BATCH_SIZE, start_cursor=cursor, keys_only=True)
+        for p_key in profiles:
+            ConferenceApi._migrateProfile(p_key)
+        return cursor.urlsafe() if more and cursor else None
+
+
+    @staticmethod
+    @ndb.transactional()
+    def _migrateProfile(p_key):
+        """Move the registrations and wishlist of the profile to it's children"""
+        prof = p_key.get()
+        if not prof.conferenceKeysToAttend and not prof.sessionWishlist:
+            return
+        entities = [
+            Registration(id=wsck, parent=p_key,
+                conference=ndb.Key(urlsafe=wsck))\
+            for wsck in prof.conferenceKeysToAttend]
+        entities.extend(
+            WishlistEntry(id=wssk, parent=p_key,
+                session=ndb.Key(urlsafe=wssk))\
+            for wssk in prof.sessionWishlist)
+        prof.conferenceKeysToAttend = []
+        prof.sessionWishlist = []
+        entities.append(prof)
+        ndb.put_multi(entities)
 
 
     @endpoints.method(message_types.VoidMessage, ProfileForm,
@@ -1160,27 +2196,63 @@ class ConferenceApi(remote.Service):
 
     @staticmethod
     def _cacheAnnouncement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job & putAnnouncement().
-        """
-        confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
-            Conference.seatsAvailable > 0)
-        ).fetch(projection=[Conference.name])
-
-        if confs:
-            # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = ANNOUNCEMENT_TPL % (
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
-        else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
+        """Reconcile the nearly sold out conferences with the seats available
+        stored in the conferences; used by the daily cron job. The set is
+        otherwise kept up to date by registrations and conference updates
+        (see announcements.py).
+        """
+        return announcements.announcement(announcements.reconcile())
+
+
+    @endpoints.method(message_types.VoidMessage, CacheStatsForm,
+            path='cacheStats',
+            http_method='GET', name='getCacheStats')
+    def getCacheStats(self, request):
+        """Return the hit/miss counters of the form cache."""
+        hits, misses = formcache.stats()
+        return CacheStatsForm(hits=hits, misses=misses)
 
-        return announcement
+
+    @endpoints.method(message_types.VoidMessage, PerfStatsForm,
+            path='perfStats',
+            http_method='GET', name='getPerfStats')
+    def getPerfStats(self, request):
+        """
+        Return the performance stats sampled by this instance, per method
+        (administrators only).
+        """
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        try:
+            admin = oauth.is_current_user_admin(EMAIL_SCOPE)
+        except oauth.Error:
+            admin = False
+        if not admin:
+            raise endpoints.ForbiddenException(
+                'Only administrators can see the performance stats.')
+
+        methods = []
+        for name, stats in sorted(perf.stats().items()):
+            calls = stats['calls']
+            methods.append(MethodPerfForm(
+                name=name,
+                calls=calls,
+                avgLatencyMs=stats['totalMs'] / calls,
+                latencyBuckets=stats['buckets'],
+                rpcs=[RpcCountForm(name=rpc, count=count)\
+                        for rpc, count in sorted(stats['rpcs'].items())],
+                memcacheHits=stats['memcacheHits'],
+                memcacheMisses=stats['memcacheMisses'],
+                avgSerializationMs=stats['serializationMs'] / calls,
+                counters=[RpcCountForm(name=counter, count=count)\
+                        for counter, count in sorted(
+                            stats['counters'].items())],
+                ))
+        return PerfStatsForm(
+                sampleRate=perf.SAMPLE_RATE,
+                bucketBoundsMs=perf.LATENCY_BUCKETS,
+                methods=methods)
 
 
     @endpoints.method(message_types.VoidMessage, StringMessage,
@@ -1189,15 +2261,15 @@ class ConferenceApi(remote.Service):
     def getAnnouncement(self, request):
         """Return Announcement from memcache."""
         return StringMessage(
-                data=memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or "")
+                data=announcements.announcement())
 
 
 # - - - Registration - - - - - - - - - - - - - - - - - - - -
 
-    @ndb.transactional(xg=True)
     def _conferenceRegistration(self, request, reg=True):
         """Register or unregister user for selected conference."""
-        retval = None
+        # the user is looked up and it's profile created (if needed) before
+        # the transactions, which only touch the entities they change
         prof = self._getProfileFromUser() # get user Profile
 
         # check if conf exists given websafeConfKey
@@ -1208,72 +2280,146 @@ class ConferenceApi(remote.Service):
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
 
+        # conferences expecting a flash crowd queue the registrations, which
+        # are admitted in batches (see admission.py); the user polls
+        # getRegistrationStatus. Registrations still queued are cancelled
+        # instead of unregistered.
+        if conf.queuedAdmission:
+            if reg:
+                admission.enqueue(prof.key, conf.key)
+                return BooleanMessage(data=True)
+            if admission.cancel(prof.key, conf.key):
+                return BooleanMessage(data=True)
+
+        return BooleanMessage(data=self._registerProfile(
+                prof.key, conf, reg, request.requestId))
+
+
+    def _registerProfile(self, p_key, conf, reg=True, request_id=None):
+        """
+        Register or unregister the profile for the conference right away,
+        returning whether it was (un)registered. No auth is done here.
+        """
+        wsck = conf.key.urlsafe()
+        # the conference seats are split among several shards (see seats.py).
+        # When registering, we try the shards with seats left in random order,
+        # falling back to the next one in case the shard was emptied in the
+        # meantime. When unregistering, the seat goes back to any shard.
+        if reg:
+            shard_keys = seats.shardsWithSeats(conf)
+        else:
+            shard_keys = [seats.randomShard(conf)]
+        for shard_key in shard_keys:
+            perf.count('registration.transactions')
+            try:
+                retval, replayed = self._registerInShard(
+                        p_key, wsck, shard_key, reg, request_id)
+            except seats.EmptyShard:
+                # someone else took the last seat of the shard
+                perf.count('registration.emptyShards')
+                continue
+            except datastore_errors.TransactionFailedError:
+                perf.count('registration.failed')
+                raise ConflictException(
+                    'Too many registrations at once, retry.')
+            if retval and not replayed:
+                total = seats.seatsChanged(conf.key, -1 if reg else 1)
+                if total is None:
+                    total = seats.seatsAvailableAsync(conf).get_result()
+                # add or remove the conference from the nearly sold out ones
+                announcements.seatsChanged(conf.key, conf.name, total)
+                # the cached form shows the seats available
+                formcache.invalidate([conf.key.urlsafe()])
+            return retval
+        raise ConflictException(
+            "There are no seats available.")
+
+
+    @unitofwork.transactional(xg=True)
+    @perf.counted('registration.attempts')
+    def _registerInShard(self, p_key, wsck, shard_key, reg, request_id=None):
+        """
+        Register or unregister the profile for the conference, taking the seat
+        from (or giving it back to) the given shard. Only the registration,
+        the shard and the record of the request id (if given) are touched.
+        Returns the result and whether it's the one of an earlier try of the
+        same request.
+        """
+        retval = None
+        # registrations are keyed by the conference websafe key
+        reg_key = ndb.Key(Registration, wsck, parent=p_key)
+        if request_id:
+            pr_key = ndb.Key(ProcessedRequest, request_id, parent=p_key)
+            processed, registration = ndb.get_multi([pr_key, reg_key])
+            if processed:
+                perf.count('registration.replayed')
+                return (processed.result, True)
+        else:
+            registration = reg_key.get()
+
         # register
         if reg:
             # check if user already registered otherwise add
-            if wsck in prof.conferenceKeysToAttend:
+            if registration:
                 raise ConflictException(
                     "You have already registered for this conference")
 
-            # check if seats avail
-            if conf.seatsAvailable <= 0:
-                raise ConflictException(
-                    "There are no seats available.")
-
-            # register user, take away one seat
-            prof.conferenceKeysToAttend.append(wsck)
-            conf.seatsAvailable -= 1
+            # register user, take away one seat (or raise EmptyShard if there
+            # are no seats left in the shard)
+            seats.takeSeat(shard_key)
+            unitofwork.add(
+                Registration(key=reg_key, conference=ndb.Key(urlsafe=wsck)))
             retval = True
 
         # unregister
         else:
             # check if user already registered
-            if wsck in prof.conferenceKeysToAttend:
+            if registration:
 
                 # unregister user, add back one seat
-                prof.conferenceKeysToAttend.remove(wsck)
-                conf.seatsAvailable += 1
+                unitofwork.delete(reg_key)
+                seats.releaseSeat(shard_key)
                 retval = True
             else:
                 retval = False
 
-        # write things back to the datastore & return
-        prof.put()
-        conf.put()
-        return BooleanMessage(data=retval)
+        if request_id:
+            unitofwork.add(ProcessedRequest(key=pr_key, result=retval))
+        return (retval, False)
 
 
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    @endpoints.method(PAGE_REQUEST, ConferenceForms,
             path='conferences/attending',
             http_method='GET', name='getConferencesToAttend')
     def getConferencesToAttend(self, request):
         """Get list of conferences that user has registered for."""
-        prof = self._getProfileFromUser() # get user Profile
-        conf_keys = [ndb.Key(urlsafe=wsck)\
-                for wsck in prof.conferenceKeysToAttend]
-        conferences = ndb.get_multi(conf_keys)
+        return self._getConferencesToAttendAsync(request).get_result()
 
-        # get organizers
-        organisers = [ndb.Key(Profile, conf.organizerUserId)\
-                for conf in conferences]
-        profiles = ndb.get_multi(organisers)
 
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+    @ndb.tasklet
+    def _getConferencesToAttendAsync(self, request):
+        """Tasklet implementing getConferencesToAttend"""
+        # get a page of the registrations of the user Profile
+        registrations, next_page_token = yield self._fetchPageAsync(
+                Registration.query(
+                    ancestor=self._getProfileKeyFromUser()).order(
+                        Registration.created),
+                request)
+        conf_keys = [registration.conference\
+                for registration in registrations]
+
+        # get conferences at once (they hold the organizer display name)
+        conferences = yield ndb.get_multi_async(conf_keys)
 
         # return set of ConferenceForm objects per Conference
-        return ConferenceForms(
-                items=[
-                    self._copyConferenceToForm(
-                        conf,
-                        names[conf.organizerUserId])\
-                    for conf in conferences]
-                )
+        raise ndb.Return(ConferenceForms(
+                items=[self._copyConferenceToForm(conf)\
+                    for conf in conferences if conf],
+                nextPageToken=next_page_token
+                ))
 
 
-    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+    @endpoints.method(CONF_REGISTER_REQUEST, BooleanMessage,
             path='conference/{websafeConferenceKey}',
             http_method='POST', name='registerForConference')
     def registerForConference(self, request):
@@ -1281,7 +2427,7 @@ class ConferenceApi(remote.Service):
         return self._conferenceRegistration(request)
 
 
-    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+    @endpoints.method(CONF_REGISTER_REQUEST, BooleanMessage,
             path='conference/{websafeConferenceKey}',
             http_method='DELETE', name='unregisterFromConference')
     def unregisterFromConference(self, request):
@@ -1289,6 +2435,22 @@ class ConferenceApi(remote.Service):
         return self._conferenceRegistration(request, reg=False)
 
 
+    @endpoints.method(CONF_GET_REQUEST, RegistrationStatusForm,
+            path='conference/{websafeConferenceKey}/registration',
+            http_method='GET', name='getRegistrationStatus')
+    def getRegistrationStatus(self, request):
+        """
+        Return the status of the registration of the user in the conference:
+        REGISTERED, QUEUED (waiting for admission), SOLD_OUT or
+        NOT_REGISTERED.
+        """
+        # only the registration and the admission ticket are read, by key
+        return RegistrationStatusForm(
+                websafeConferenceKey=request.websafeConferenceKey,
+                status=admission.status(self._getProfileKeyFromUser(),
+                    ndb.Key(urlsafe=request.websafeConferenceKey)))
+
+
     @endpoints.method(message_types.VoidMessage, SessionForms,
             path='filterPlayground',
             http_method='GET', name='filterPlayground')
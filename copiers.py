@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""
+copiers.py -- Udacity conference server-side Python App Engine copiers of
+    ndb entities to ProtoRPC forms
+
+The _copy*ToForm methods used to loop over all the fields of the form for
+every entity, checking with hasattr which ones the model has and comparing
+their names to find the ones needing a conversion. A Copier does all that
+once per model/form pair, at import time, and keeps the result as a tuple of
+(field name, accessor, converter), so copying an entity is just a pass over
+that tuple.
+
+"""
+
+import operator
+
+from models import Conference
+from models import ConferenceForm
+from models import Profile
+from models import ProfileForm
+from models import Session
+from models import SessionForm
+from models import Speaker
+from models import SpeakerForm
+from models import TeeShirtSize
+
+
+def _toString(value):
+    """Convert date and time values to string"""
+    return str(value)
+
+
+def _toWebsafeKeys(keys):
+    """Convert a list of keys to their websafe versions"""
+    return [key.urlsafe() for key in keys]
+
+
+def _toTeeShirtSize(value):
+    """Convert the t-shirt size string to it's enum"""
+    return getattr(TeeShirtSize, value)
+
+
+class Copier(object):
+    """Copier -- precompiled copy of the fields of a model to a form"""
+
+    def __init__(self, model_cls, form_cls, converters=None, names=None):
+        converters = converters or {}
+        fields = form_cls.all_fields()
+        self.model_cls = model_cls
+        self.form_cls = form_cls
+        self.converters = converters
+        # fields the model has (restricted to names, if given), with the
+        # converter of their values (if any)
+        self.fields = tuple(
+            (field.name, operator.attrgetter(field.name),
+                converters.get(field.name))\
+            for field in fields if hasattr(model_cls, field.name) and\
+                (names is None or field.name in names))
+        form_names = set(field.name for field in fields)
+        self.copyKey = 'websafeKey' in form_names and\
+                not hasattr(model_cls, 'websafeKey')
+        # forms without required fields don't need to be checked
+        self.checkRequired = any(field.required for field in fields)
+        self._restricted = {}
+
+    def restrict(self, names):
+        """
+        Return a copier of the given fields only, e.g. for the entities of a
+        projection query, which raise on access to the other properties.
+        Restricted copiers are only built once for each set of fields.
+        """
+        names = frozenset(names)
+        copier = self._restricted.get(names)
+        if copier is None:
+            copier = self._restricted[names] = Copier(
+                    self.model_cls, self.form_cls, self.converters, names)
+        return copier
+
+    def copy(self, entity, **extra):
+        """
+        Copy the entity to a new form. Extra fields (e.g. display names) are
+        only set when they hold a value.
+        """
+        values = {}
+        for name, get, convert in self.fields:
+            value = get(entity)
+            values[name] = convert(value) if convert else value
+        if self.copyKey:
+            values['websafeKey'] = entity.key.urlsafe()
+        for name, value in extra.iteritems():
+            if value:
+                values[name] = value
+        form = self.form_cls(**values)
+        if self.checkRequired:
+            form.check_initialized()
+        return form
+
+
+CONFERENCE_COPIER = Copier(Conference, ConferenceForm, {
+    'startDate': _toString,
+    'endDate': _toString,
+})
+
+SESSION_COPIER = Copier(Session, SessionForm, {
+    'date': _toString,
+    'startTime': _toString,
+})
+
+SPEAKER_COPIER = Copier(Speaker, SpeakerForm, {
+    'sessions': _toWebsafeKeys,
+})
+
+PROFILE_COPIER = Copier(Profile, ProfileForm, {
+    'teeShirtSize': _toTeeShirtSize,
+})
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+"""
+formcache.py -- Udacity conference server-side Python App Engine read-through
+    memcache of the ProtoRPC forms built from entities
+
+Forms are cached under the websafe key of their entity and a version of the
+entity, which is a counter also kept in memcache. Invalidating the cached forms
+of an entity is simply bumping it's version, so forms built from stale data are
+never served, even if stored after the invalidation.
+
+"""
+
+import time
+
+from google.appengine.ext import ndb
+from protorpc import protojson
+
+# form class name, websafe key and version
+MEMCACHE_FORM_KEY = 'FORM:%s:%s:%s'
+MEMCACHE_VERSION_KEY = 'FORM_VERSION:%s'
+MEMCACHE_HITS_KEY = 'FORM_CACHE_HITS'
+MEMCACHE_MISSES_KEY = 'FORM_CACHE_MISSES'
+FORM_CACHE_TIME = 3600
+
+
+def _initialVersion():
+    """
+    Versions evicted from memcache start over from the current time, so they
+    never go back to a version that may still have forms cached.
+    """
+    return int(time.time() * 1000)
+
+
+@ndb.tasklet
+def _getVersionsAsync(websafeKeys):
+    """Return the current version of each of the entities"""
+    ctx = ndb.get_context()
+    versions = yield [ctx.memcache_get(MEMCACHE_VERSION_KEY % websafeKey)\
+            for websafeKey in websafeKeys]
+    missing = [i for i, version in enumerate(versions) if version is None]
+    if missing:
+        initial = _initialVersion()
+        yield [ctx.memcache_add(MEMCACHE_VERSION_KEY % websafeKeys[i], initial)\
+                for i in missing]
+        # someone else may have set the version in the meantime
+        fresh = yield [ctx.memcache_get(MEMCACHE_VERSION_KEY % websafeKeys[i])\
+                for i in missing]
+        for i, version in zip(missing, fresh):
+            versions[i] = version if version is not None else initial
+    raise ndb.Return(versions)
+
+
+@ndb.tasklet
+def getAsync(form_cls, websafeKeys):
+    """
+    Return the cached forms of the entities (None for the ones not cached) and
+    their versions, which must be handed to setAsync when caching the missing
+    forms.
+    """
+    if not websafeKeys:
+        raise ndb.Return(([], []))
+    ctx = ndb.get_context()
+    versions = yield _getVersionsAsync(websafeKeys)
+    cached = yield [
+        ctx.memcache_get(MEMCACHE_FORM_KEY % (
+            form_cls.__name__, websafeKey, version))\
+        for websafeKey, version in zip(websafeKeys, versions)]
+    forms = [protojson.decode_message(form_cls, data) if data else None\
+            for data in cached]
+    hits = len([form for form in forms if form is not None])
+    counters = []
+    if hits:
+        counters.append(ctx.memcache_incr(
+            MEMCACHE_HITS_KEY, delta=hits, initial_value=0))
+    if hits < len(forms):
+        counters.append(ctx.memcache_incr(
+            MEMCACHE_MISSES_KEY, delta=len(forms) - hits, initial_value=0))
+    if counters:
+        yield counters
+    raise ndb.Return((forms, versions))
+
+
+@ndb.tasklet
+def setAsync(form_cls, websafeKeys, versions, forms):
+    """Cache the forms of the entities, under the versions given by getAsync"""
+    if not websafeKeys:
+        return
+    ctx = ndb.get_context()
+    yield [
+        ctx.memcache_set(
+            MEMCACHE_FORM_KEY % (form_cls.__name__, websafeKey, version),
+            protojson.encode_message(form),
+            time=FORM_CACHE_TIME)\
+        for websafeKey, version, form in zip(websafeKeys, versions, forms)]
+
+
+def invalidate(websafeKeys):
+    """
+    Invalidate the cached forms of the entities, once the current transaction
+    (if any) commits.
+    """
+    def bumpVersions():
+        ctx = ndb.get_context()
+        initial = _initialVersion()
+        ndb.Future.wait_all([
+            ctx.memcache_incr(MEMCACHE_VERSION_KEY % websafeKey,
+                initial_value=initial)\
+            for websafeKey in set(websafeKeys)])
+    ndb.get_context().call_on_commit(bumpVersions)
+
+
+def stats():
+    """Return the number of cache hits and misses"""
+    ctx = ndb.get_context()
+    hits, misses = ctx.memcache_get(MEMCACHE_HITS_KEY),\
+            ctx.memcache_get(MEMCACHE_MISSES_KEY)
+    return (hits.get_result() or 0, misses.get_result() or 0)
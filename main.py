@@ -15,11 +15,14 @@ __author__ = 'wesc+api@google.com (Wesley Chun)'
 import webapp2
 from google.appengine.api import app_identity
 from google.appengine.api import mail
+from google.appengine.api import taskqueue
 from conference import ConferenceApi
+import admission
+import seats
 
 class SetAnnouncementHandler(webapp2.RequestHandler):
     def get(self):
-        """Set Announcement in Memcache."""
+        """Reconcile the nearly sold out conferences."""
         ConferenceApi._cacheAnnouncement()
         self.response.set_status(204)
 
@@ -28,8 +31,93 @@ class SetFeaturedSpeakerHandler(webapp2.RequestHandler):
     def post(self):
         """Set featured speaker in Memcache"""
         ConferenceApi._cacheFeaturedSpeaker(
-                self.request.get('websafeSpeakerKey'),
-                self.request.get('websafeConferenceKey'),)
+                self.request.get('websafeConferenceKey'))
+        self.response.set_status(204)
+
+
+class SyncSeatsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Sync the seats available in a conference with it's seat shards"""
+        seats.syncConference(self.request.get('websafeConferenceKey'))
+        self.response.set_status(204)
+
+
+class AdmitRegistrationsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Admit the queued registrations of a conference in batches"""
+        handled = admission.admitAll(self.request.get('websafeConferenceKey'))
+        if handled is None:
+            # another worker of the conference is running; the task is
+            # retried later, in case the registrations queued meanwhile were
+            # left for this one
+            self.response.set_status(503)
+        else:
+            self.response.set_status(204)
+
+
+class MigrationHandler(webapp2.RequestHandler):
+    """Runs a migration in batches on the task queue. Subclasses define
+    migrate, which migrates the batch starting at the given cursor and
+    returns the cursor of the next one."""
+    def get(self):
+        """Start the migration."""
+        taskqueue.add(url=self.request.path)
+        self.response.set_status(202)
+
+    def post(self):
+        """Migrate a batch, queueing the next one if any."""
+        cursor = self.migrate(self.request.get('cursor'))
+        if cursor:
+            taskqueue.add(params={'cursor': cursor}, url=self.request.path)
+        self.response.set_status(204)
+
+
+class MigrateSpeakersHandler(MigrationHandler):
+    """Migrate speakers to name based keys."""
+    migrate = staticmethod(ConferenceApi._migrateSpeakers)
+
+
+class BackfillSessionSpeakersHandler(MigrationHandler):
+    """Set the speaker key of existing sessions."""
+    migrate = staticmethod(ConferenceApi._backfillSessionSpeakers)
+
+
+class MigrateProfilesHandler(MigrationHandler):
+    """Move registrations and wishlists to children of the profiles."""
+    migrate = staticmethod(ConferenceApi._migrateProfiles)
+
+
+class BackfillOrganizerNamesHandler(MigrationHandler):
+    """Store the organizer name in existing conferences."""
+    migrate = staticmethod(ConferenceApi._backfillOrganizerNames)
+
+
+class UpdateOrganizerNameHandler(webapp2.RequestHandler):
+    def post(self):
+        """Copy the organizer name to a batch of it's conferences, queueing
+        the next batch if any."""
+        user_id = self.request.get('userId')
+        cursor = ConferenceApi._updateOrganizerName(
+                user_id, self.request.get('cursor'))
+        if cursor:
+            ConferenceApi._queueOrganizerNameUpdate(user_id, cursor)
+        self.response.set_status(204)
+
+
+class BackfillSessionConferenceNamesHandler(MigrationHandler):
+    """Store the conference name in existing sessions."""
+    migrate = staticmethod(ConferenceApi._backfillSessionConferenceNames)
+
+
+class UpdateConferenceNameHandler(webapp2.RequestHandler):
+    def post(self):
+        """Copy the conference name to a batch of it's sessions, queueing the
+        next batch if any."""
+        wsck = self.request.get('websafeConferenceKey')
+        cursor = ConferenceApi._updateConferenceName(
+                wsck, self.request.get('cursor'))
+        if cursor:
+            ConferenceApi._queueConferenceNameUpdate(wsck, cursor)
         self.response.set_status(204)
 
 
@@ -51,4 +139,14 @@ app = webapp2.WSGIApplication([
     ('/crons/set_announcement', SetAnnouncementHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
     ('/tasks/set_featured_speaker', SetFeaturedSpeakerHandler),
+    ('/tasks/sync_seats', SyncSeatsHandler),
+    ('/tasks/admit_registrations', AdmitRegistrationsHandler),
+    ('/tasks/migrate_speakers', MigrateSpeakersHandler),
+    ('/tasks/backfill_session_speakers', BackfillSessionSpeakersHandler),
+    ('/tasks/migrate_profiles', MigrateProfilesHandler),
+    ('/tasks/backfill_organizer_names', BackfillOrganizerNamesHandler),
+    ('/tasks/update_organizer_name', UpdateOrganizerNameHandler),
+    ('/tasks/backfill_session_conference_names',
+        BackfillSessionConferenceNamesHandler),
+    ('/tasks/update_conference_name', UpdateConferenceNameHandler),
 ], debug=True)
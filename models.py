@@ -17,6 +17,8 @@ import endpoints
 from protorpc import messages
 from google.appengine.ext import ndb
 
+import querycache
+
 class ConflictException(endpoints.ServiceException):
     """ConflictException -- exception mapped to HTTP 409 response"""
     http_status = httplib.CONFLICT
@@ -26,8 +28,37 @@ class Profile(ndb.Model):
     displayName     = ndb.StringProperty()
     mainEmail       = ndb.StringProperty()
     teeShirtSize    = ndb.StringProperty(default='NOT_SPECIFIED')
+    # replaced by the Registration and WishlistEntry children of the profile;
+    # only kept until existing profiles are migrated
     conferenceKeysToAttend = ndb.StringProperty(repeated=True)
     sessionWishlist = ndb.StringProperty(repeated=True)
+    # incremented on every change to the wishlist, used as it's etag
+    wishlistVersion = ndb.IntegerProperty(default=0, indexed=False)
+
+class ProcessedRequest(ndb.Model):
+    """ProcessedRequest -- client request already applied to the entity group
+    of it's parent, keyed by the request id, so retries of the request are
+    not applied twice"""
+    result          = ndb.BooleanProperty(indexed=False)
+    created         = ndb.DateTimeProperty(auto_now_add=True)
+
+class Registration(ndb.Model):
+    """Registration -- registration of the parent Profile in a conference,
+    keyed by the conference websafe key"""
+    conference      = ndb.KeyProperty(kind='Conference')
+    created         = ndb.DateTimeProperty(auto_now_add=True)
+
+class AdmissionTicket(ndb.Model):
+    """AdmissionTicket -- registration request of the parent Profile in a
+    conference with queued admission, keyed by the conference websafe key"""
+    status          = ndb.StringProperty(indexed=False)
+    created         = ndb.DateTimeProperty(auto_now_add=True)
+
+class WishlistEntry(ndb.Model):
+    """WishlistEntry -- session in the wishlist of the parent Profile, keyed
+    by the session websafe key"""
+    session         = ndb.KeyProperty(kind='Session')
+    created         = ndb.DateTimeProperty(auto_now_add=True)
 
 class ProfileMiniForm(messages.Message):
     """ProfileMiniForm -- update Profile form message"""
@@ -50,7 +81,65 @@ class BooleanMessage(messages.Message):
     """BooleanMessage-- outbound Boolean value message"""
     data = messages.BooleanField(1)
 
-class Conference(ndb.Model):
+class CacheStatsForm(messages.Message):
+    """CacheStatsForm -- outbound form cache hit/miss counters"""
+    hits = messages.IntegerField(1)
+    misses = messages.IntegerField(2)
+
+class RegistrationStatusForm(messages.Message):
+    """RegistrationStatusForm -- outbound status of the registration of the
+    user in a conference"""
+    websafeConferenceKey = messages.StringField(1)
+    status          = messages.StringField(2)
+
+class RpcCountForm(messages.Message):
+    """RpcCountForm -- number of RPCs of a kind"""
+    name = messages.StringField(1)
+    count = messages.IntegerField(2)
+
+class MethodPerfForm(messages.Message):
+    """MethodPerfForm -- sampled performance stats of an API method"""
+    name = messages.StringField(1)
+    calls = messages.IntegerField(2)
+    avgLatencyMs = messages.FloatField(3)
+    latencyBuckets = messages.IntegerField(4, repeated=True)
+    rpcs = messages.MessageField(RpcCountForm, 5, repeated=True)
+    memcacheHits = messages.IntegerField(6)
+    memcacheMisses = messages.IntegerField(7)
+    avgSerializationMs = messages.FloatField(8)
+    counters = messages.MessageField(RpcCountForm, 9, repeated=True)
+
+class PerfStatsForm(messages.Message):
+    """PerfStatsForm -- outbound performance stats of this instance"""
+    sampleRate = messages.FloatField(1)
+    bucketBoundsMs = messages.IntegerField(2, repeated=True)
+    methods = messages.MessageField(MethodPerfForm, 3, repeated=True)
+
+class QueryCachedModel(ndb.Model):
+    """QueryCachedModel -- model whose query results are cached by
+    querycache. Every put or delete drops the cached pages of the kind once
+    written: when the transaction commits, or else after the write, so a
+    concurrent query can't cache the old results under the new generation."""
+
+    def _pre_put_hook(self):
+        if ndb.in_transaction():
+            querycache.invalidate(self._get_kind())
+
+    def _post_put_hook(self, future):
+        if not ndb.in_transaction():
+            querycache.invalidate(self._get_kind())
+
+    @classmethod
+    def _pre_delete_hook(cls, key):
+        if ndb.in_transaction():
+            querycache.invalidate(cls._get_kind())
+
+    @classmethod
+    def _post_delete_hook(cls, key, future):
+        if not ndb.in_transaction():
+            querycache.invalidate(cls._get_kind())
+
+class Conference(QueryCachedModel):
     """Conference -- Conference object"""
     name            = ndb.StringProperty(required=True)
     description     = ndb.StringProperty()
@@ -62,6 +151,21 @@ class Conference(ndb.Model):
     endDate         = ndb.DateProperty()
     maxAttendees    = ndb.IntegerProperty()
     seatsAvailable  = ndb.IntegerProperty()
+    # copied from the organizer Profile, so listings don't need to fetch it.
+    # Indexed, so the summary views can project it.
+    organizerDisplayName = ndb.StringProperty()
+    # registrations are queued and admitted in batches (see admission.py)
+    queuedAdmission = ndb.BooleanProperty(default=False, indexed=False)
+
+class NearlySoldOut(ndb.Model):
+    """NearlySoldOut -- conference with a few seats left, child of the
+    announcements root and keyed by the conference websafe key"""
+    name            = ndb.StringProperty(indexed=False)
+
+class SeatShard(ndb.Model):
+    """SeatShard -- slice of the seats available in a conference"""
+    conference      = ndb.KeyProperty(kind='Conference')
+    seats           = ndb.IntegerProperty(default=0, indexed=False)
 
 class ConferenceForm(messages.Message):
     """ConferenceForm -- Conference outbound form message"""
@@ -77,6 +181,7 @@ class ConferenceForm(messages.Message):
     endDate         = messages.StringField(10) #DateTimeField()
     websafeKey      = messages.StringField(11)
     organizerDisplayName = messages.StringField(12)
+    queuedAdmission = messages.BooleanField(13)
 
 class ConferenceUpdateForm(messages.Message):
     """ConferenceUpdateForm -- Conference inbound form message"""
@@ -89,21 +194,26 @@ class ConferenceUpdateForm(messages.Message):
     maxAttendees    = messages.IntegerField(7, variant=messages.Variant.INT32)
     seatsAvailable  = messages.IntegerField(8, variant=messages.Variant.INT32)
     endDate         = messages.StringField(9) #DateTimeField()
+    queuedAdmission = messages.BooleanField(10)
 
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
 
-class Session(ndb.Model):
+class Session(QueryCachedModel):
     """Session -- Session object"""
     name            = ndb.StringProperty(required=True)
     highlights      = ndb.StringProperty(repeated=True)
     speakerDisplayName = ndb.StringProperty()
+    speakerKey      = ndb.KeyProperty(kind='Speaker')
     duration        = ndb.IntegerProperty()
     typeOfSession   = ndb.StringProperty()
     date            = ndb.DateProperty()
     startTime       = ndb.TimeProperty()
     conferenceId    = ndb.IntegerProperty()
+    # copied from the parent Conference, so listings don't need to fetch it
+    conferenceDisplayName = ndb.StringProperty(indexed=False)
 
 class SessionForm(messages.Message):
     """SessionForm -- Session outbound form message"""
@@ -131,9 +241,12 @@ class SessionUpdateForm(messages.Message):
 class SessionForms(messages.Message):
     """SessionForms -- holder for several session outbound forms"""
     items = messages.MessageField(SessionForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    etag = messages.StringField(3)
+    notModified = messages.BooleanField(4)
 
 class Speaker(ndb.Model):
-    """Speaker -- Kind model"""
+    """Speaker -- Kind model, keyed by the normalized speaker name"""
     name            = ndb.StringProperty(required=True)
     specialties     = ndb.StringProperty(repeated=True)
     city            = ndb.StringProperty()
@@ -141,6 +254,24 @@ class Speaker(ndb.Model):
     languages       = ndb.StringProperty(repeated=True)
     sessions        = ndb.KeyProperty(kind=Session, repeated=True)
 
+    @staticmethod
+    def normalizeName(name):
+        """Return the speaker name as used for the speaker id"""
+        return u' '.join(name.split()).lower()
+
+    @classmethod
+    def keyForName(cls, name):
+        """Return the key of the speaker with the given name"""
+        return ndb.Key(cls, cls.normalizeName(name))
+
+class ConferenceSpeakerStats(ndb.Model):
+    """ConferenceSpeakerStats -- sessions of each speaker in a conference.
+    Child of the conference, so it's updated in the same transaction as the
+    conference sessions."""
+    # maps speaker ids to the ids of their sessions in the conference
+    speakerSessions = ndb.JsonProperty()
+    featuredSpeaker = ndb.StringProperty(indexed=False)
+
 class SpeakerForm(messages.Message):
     """SpeakerForm -- outbound speaker message form"""
     name            = messages.StringField(1)
@@ -195,4 +326,7 @@ class ConferenceQueryForms(messages.Message):
 
     """
     filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2, variant=messages.Variant.INT32)
+    pageToken = messages.StringField(3)
+    view = messages.StringField(4)
 
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+"""
+perf.py -- Udacity conference server-side Python App Engine per request
+    performance instrumentation
+
+Every remote method of a service decorated with profileService is timed,
+along with the API RPCs it makes (datastore gets, queries, puts, id
+allocations...), the memcache hits and misses and the time spent copying
+entities to forms. Each call is logged as a JSON line, and a sample of the
+calls is added to an in-memory histogram per method, which lives as long as
+the instance does. Methods can also count events of their own (e.g. the
+attempts of their transactions) with count and counted.
+
+"""
+
+import functools
+import json
+import logging
+import random
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+
+# fraction of the calls added to the histograms
+SAMPLE_RATE = 0.2
+# upper bounds (in ms) of the latency buckets of the histograms; the last
+# bucket holds everything slower
+LATENCY_BUCKETS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# short names of the datastore calls
+DATASTORE_CALLS = {
+    'Get': 'get',
+    'RunQuery': 'query',
+    'Next': 'query',
+    'Put': 'put',
+    'Delete': 'delete',
+    'AllocateIds': 'allocate_ids',
+    'BeginTransaction': 'transaction',
+    'Commit': 'commit',
+    'Rollback': 'rollback',
+}
+
+_local = threading.local()
+_lock = threading.Lock()
+# method name -> aggregated stats of it's sampled calls
+_histograms = {}
+
+
+class CallRecord(object):
+    """CallRecord -- measurements of a single remote method call"""
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.time()
+        self.rpcs = {}
+        self.memcacheHits = 0
+        self.memcacheMisses = 0
+        self.serialization = 0.0
+        self.counters = {}
+
+    def toDict(self, elapsed):
+        return {
+            'method': self.name,
+            'wallMs': round(elapsed * 1000, 2),
+            'rpcs': self.rpcs,
+            'memcacheHits': self.memcacheHits,
+            'memcacheMisses': self.memcacheMisses,
+            'serializationMs': round(self.serialization * 1000, 2),
+            'counters': self.counters,
+        }
+
+
+def _current():
+    return getattr(_local, 'record', None)
+
+
+def _preCall(service, call, request, response):
+    """Count the RPCs made by the current call"""
+    record = _current()
+    if record is None:
+        return
+    if service == 'datastore_v3':
+        name = DATASTORE_CALLS.get(call, call)
+    else:
+        name = '%s.%s' % (service, call)
+    record.rpcs[name] = record.rpcs.get(name, 0) + 1
+
+
+def _postCall(service, call, request, response):
+    """Count the memcache hits and misses of the current call"""
+    record = _current()
+    if record is None or service != 'memcache' or call != 'Get':
+        return
+    hits = response.item_size()
+    record.memcacheHits += hits
+    record.memcacheMisses += request.key_size() - hits
+
+
+apiproxy_stub_map.apiproxy.GetPreCallHooks().Append('perf', _preCall)
+apiproxy_stub_map.apiproxy.GetPostCallHooks().Append('perf', _postCall)
+
+
+def _bucket(elapsed_ms):
+    """Return the index of the latency bucket of the call"""
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if elapsed_ms <= bound:
+            return i
+    return len(LATENCY_BUCKETS)
+
+
+def _addSample(record, elapsed):
+    """Add the call to the histogram of it's method"""
+    elapsed_ms = elapsed * 1000
+    with _lock:
+        stats = _histograms.setdefault(record.name, {
+            'calls': 0,
+            'totalMs': 0.0,
+            'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+            'rpcs': {},
+            'memcacheHits': 0,
+            'memcacheMisses': 0,
+            'serializationMs': 0.0,
+            'counters': {},
+        })
+        stats['calls'] += 1
+        stats['totalMs'] += elapsed_ms
+        stats['buckets'][_bucket(elapsed_ms)] += 1
+        for name, count in record.rpcs.items():
+            stats['rpcs'][name] = stats['rpcs'].get(name, 0) + count
+        stats['memcacheHits'] += record.memcacheHits
+        stats['memcacheMisses'] += record.memcacheMisses
+        stats['serializationMs'] += record.serialization * 1000
+        for name, count in record.counters.items():
+            stats['counters'][name] = stats['counters'].get(name, 0) + count
+
+
+def profiled(method):
+    """
+    Decorator recording the measurements of the calls to the method. Calls
+    made while another call is being recorded (e.g. a remote method calling
+    another one) are counted as part of the outer one.
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if _current() is not None:
+            return method(*args, **kwargs)
+        record = _local.record = CallRecord(method.__name__)
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _local.record = None
+            elapsed = time.time() - record.start
+            logging.info('perf %s', json.dumps(record.toDict(elapsed)))
+            if random.random() < SAMPLE_RATE:
+                _addSample(record, elapsed)
+    return wrapper
+
+
+def profileService(cls):
+    """
+    Class decorator profiling every remote method of a protorpc service. The
+    wrappers keep the attributes of the remote methods (functools.wraps
+    copies their __dict__), which is where endpoints and protorpc keep the
+    method configuration.
+    """
+    for name, value in cls.__dict__.items():
+        if hasattr(value, 'remote'):
+            setattr(cls, name, profiled(value))
+    return cls
+
+
+def timed(method):
+    """
+    Decorator adding the time spent in the method to the serialization time
+    of the current call.
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        record = _current()
+        if record is None:
+            return method(*args, **kwargs)
+        start = time.time()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            record.serialization += time.time() - start
+    return wrapper
+
+
+def count(name, n=1):
+    """Add n to the counter of the current call"""
+    record = _current()
+    if record is not None:
+        record.counters[name] = record.counters.get(name, 0) + n
+
+
+def counted(name):
+    """
+    Decorator counting the calls to the function under the given name. Used
+    inside ndb.transactional to count the attempts of a transaction, as ndb
+    calls it again on every retry.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            count(name)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def stats():
+    """Return a copy of the histograms of the sampled calls, by method"""
+    with _lock:
+        return dict((name, dict(value, buckets=list(value['buckets']),
+                rpcs=dict(value['rpcs']), counters=dict(value['counters'])))\
+            for name, value in _histograms.items())
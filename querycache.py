@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""
+querycache.py -- Udacity conference server-side Python App Engine memcache of
+    the keys of query result pages
+
+The keys of a page of results are cached under the signature of the query
+(kind, filters, ancestor...), the page requested and a generation of the kind,
+a counter also kept in memcache. Every put or delete of an entity of the kind
+bumps it's generation (see the model hooks in models.py), so the cached pages
+of a kind are all dropped at once whenever any of it's entities change.
+Entities are then got by key, which ndb serves from it's own caches.
+
+"""
+
+import hashlib
+import time
+
+from google.appengine.ext import ndb
+
+# kind, generation, query signature, page size and page token
+MEMCACHE_PAGE_KEY = 'QUERY:%s:%s:%s:%s:%s'
+MEMCACHE_GENERATION_KEY = 'QUERY_GENERATION:%s'
+# non ancestor queries are eventually consistent, so a page may be cached
+# without an entity just written; it's only kept for so long.
+QUERY_CACHE_TIME = 120
+
+
+def _initialGeneration():
+    """
+    Generations evicted from memcache start over from the current time, so
+    they never go back to a generation that may still have pages cached.
+    """
+    return int(time.time() * 1000)
+
+
+def signature(*parts):
+    """
+    Return the signature of a query, built from it's parts (kind, normalized
+    filters, ancestor...), which must have a stable repr.
+    """
+    return hashlib.md5(repr(parts)).hexdigest()
+
+
+@ndb.tasklet
+def _getGenerationAsync(kind):
+    """Return the current generation of the kind"""
+    ctx = ndb.get_context()
+    key = MEMCACHE_GENERATION_KEY % kind
+    generation = yield ctx.memcache_get(key)
+    if generation is None:
+        yield ctx.memcache_add(key, _initialGeneration())
+        # someone else may have set the generation in the meantime
+        generation = yield ctx.memcache_get(key)
+    raise ndb.Return(generation)
+
+
+@ndb.tasklet
+def getAsync(kind, signature, size, token):
+    """
+    Return the cached keys and next page token of the page of the query (None
+    if it's not cached) and the generation of the kind, which must be handed
+    to setAsync when caching the page.
+    """
+    generation = yield _getGenerationAsync(kind)
+    if generation is None:
+        # memcache is down
+        raise ndb.Return((None, None))
+    page = yield ndb.get_context().memcache_get(
+            MEMCACHE_PAGE_KEY % (kind, generation, signature, size, token))
+    raise ndb.Return((page, generation))
+
+
+@ndb.tasklet
+def setAsync(kind, generation, signature, size, token, keys, nextToken):
+    """Cache the keys and next page token of the page of the query"""
+    if generation is None:
+        return
+    yield ndb.get_context().memcache_set(
+            MEMCACHE_PAGE_KEY % (kind, generation, signature, size, token),
+            (keys, nextToken), time=QUERY_CACHE_TIME)
+
+
+def invalidate(kind):
+    """
+    Drop the cached pages of the kind, once the current transaction (if any)
+    commits. The generation is only bumped once per transaction, however many
+    entities of the kind it writes.
+    """
+    ctx = ndb.get_context()
+    if ndb.in_transaction():
+        kinds = getattr(ctx, '_invalidatedKinds', None)
+        if kinds is None:
+            kinds = ctx._invalidatedKinds = set()
+        if kind in kinds:
+            return
+        kinds.add(kind)
+
+    def bumpGeneration():
+        ndb.get_context().memcache_incr(MEMCACHE_GENERATION_KEY % kind,
+                initial_value=_initialGeneration()).get_result()
+    ctx.call_on_commit(bumpGeneration)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+"""
+seats.py -- Udacity conference server-side Python App Engine sharded seat
+    counters
+
+Instead of rewriting the Conference entity on every registration, the seats
+available in a conference are split among NUM_SHARDS counter shards (each one
+a separate entity group). Registrations take a seat from a random shard, so
+registrations for the same conference don't contend on a single entity.
+Conference.seatsAvailable is kept in sync by a task, scheduled at most once
+every SYNC_INTERVAL seconds per conference.
+
+"""
+
+import random
+import time
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import SeatShard
+import announcements
+import unitofwork
+
+NUM_SHARDS = 20
+# seconds between the syncs of Conference.seatsAvailable with the shards
+SYNC_INTERVAL = 10
+MEMCACHE_SEATS_KEY = 'SEATS_AVAILABLE:%s'
+# seconds the total of seats available is kept in memcache
+SEATS_CACHE_TIME = 60
+
+
+class EmptyShard(Exception):
+    """EmptyShard -- raised when taking a seat from a shard with no seats"""
+
+
+def shardKeys(conf_key):
+    """Return the keys of the seat shards of the conference"""
+    return [ndb.Key(SeatShard, '%s-%d' % (conf_key.urlsafe(), i))\
+            for i in range(NUM_SHARDS)]
+
+
+def _splitSeats(seats):
+    """Split the seats among the shards, as evenly as possible"""
+    base, extra = divmod(max(seats, 0), NUM_SHARDS)
+    return [base + (1 if i < extra else 0) for i in range(NUM_SHARDS)]
+
+
+def _newShards(conf_key, seats):
+    """Return the seat shards of the conference, holding the given seats"""
+    return [SeatShard(key=key, conference=conf_key, seats=n)\
+            for key, n in zip(shardKeys(conf_key), _splitSeats(seats))]
+
+
+def initSeats(conf_key, seats):
+    """
+    Create the seat shards of a new conference (written with the other
+    entities of the request, if in a unit of work).
+    """
+    unitofwork.add(*_newShards(conf_key, seats))
+    memcache.set(MEMCACHE_SEATS_KEY % conf_key.urlsafe(), max(seats, 0),
+            time=SEATS_CACHE_TIME)
+
+
+@ndb.non_transactional
+def resetSeats(conf_key, seats):
+    """
+    Split the seats available among the shards of an existing conference,
+    overwriting their counts. Used when the organizer changes the number of
+    seats available. The shards are written right away, not with the unit of
+    work of the request, so they match the cached total by the time the
+    update commits and the nearly sold out set is updated.
+    """
+    ndb.put_multi(_newShards(conf_key, seats))
+    memcache.set(MEMCACHE_SEATS_KEY % conf_key.urlsafe(), max(seats, 0),
+            time=SEATS_CACHE_TIME)
+
+
+def getShards(conf):
+    """
+    Return the seat shards of the conference. The shards of conferences
+    created before seats were sharded are created from
+    Conference.seatsAvailable (get_or_insert, so concurrent requests don't
+    overwrite each other's registrations).
+    """
+    keys = shardKeys(conf.key)
+    shards = ndb.get_multi(keys)
+    if all(shard is None for shard in shards):
+        futures = [
+            SeatShard.get_or_insert_async(
+                key.id(), conference=conf.key, seats=n)\
+            for key, n in zip(keys, _splitSeats(conf.seatsAvailable or 0))]
+        shards = [future.get_result() for future in futures]
+    return shards
+
+
+def shardsWithSeats(conf):
+    """Return the keys of the shards with seats left, in random order"""
+    keys = [shard.key for shard in getShards(conf) if shard and shard.seats > 0]
+    random.shuffle(keys)
+    return keys
+
+
+def randomShard(conf):
+    """Return the key of a random shard, to give back a seat to"""
+    return random.choice(getShards(conf)).key
+
+
+def takeSeat(shard_key):
+    """
+    Take a seat from the shard, raising EmptyShard if there are none left.
+    Must run inside the registration transaction, whose unit of work writes
+    the shard.
+    """
+    shard = shard_key.get()
+    if not shard or shard.seats <= 0:
+        raise EmptyShard()
+    shard.seats -= 1
+    unitofwork.add(shard)
+
+
+def releaseSeat(shard_key):
+    """Give a seat back to the shard. Must run inside a transaction."""
+    shard = shard_key.get()
+    shard.seats += 1
+    unitofwork.add(shard)
+
+
+def seatsChanged(conf_key, delta):
+    """
+    Update the cached total of seats available after a registration has been
+    committed, and schedule the sync of Conference.seatsAvailable. Returns the
+    new total, or None if it wasn't cached.
+    """
+    key = MEMCACHE_SEATS_KEY % conf_key.urlsafe()
+    if delta < 0:
+        seats = memcache.decr(key, -delta)
+    else:
+        seats = memcache.incr(key, delta)
+    scheduleSync(conf_key)
+    return seats
+
+
+def scheduleSync(conf_key):
+    """
+    Schedule the sync of Conference.seatsAvailable. Tasks are named after the
+    conference and the current SYNC_INTERVAL, so there is at most one of them
+    per interval.
+    """
+    bucket = int(time.time()) // SYNC_INTERVAL
+    try:
+        taskqueue.add(
+                name='sync-seats-%s-%d' % (conf_key.urlsafe(), bucket),
+                countdown=SYNC_INTERVAL,
+                params={'websafeConferenceKey': conf_key.urlsafe()},
+                url='/tasks/sync_seats')
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        # the sync for this interval is already scheduled
+        pass
+
+
+def syncConference(websafeConferenceKey):
+    """
+    Copy the total of seats available in the shards to the conference, and
+    check the conference is in the nearly sold out set only if it should be
+    (the registrations since the last sync may have updated it out of order).
+    """
+    conf_key = ndb.Key(urlsafe=websafeConferenceKey)
+    shards = ndb.get_multi(shardKeys(conf_key))
+    if all(shard is None for shard in shards):
+        return
+    seats = sum(shard.seats for shard in shards if shard)
+    conf = _setConferenceSeats(conf_key, seats)
+    memcache.set(MEMCACHE_SEATS_KEY % websafeConferenceKey, seats,
+            time=SEATS_CACHE_TIME)
+    if conf:
+        announcements.seatsChanged(conf_key, conf.name, seats, check=True)
+
+
+@ndb.transactional()
+def _setConferenceSeats(conf_key, seats):
+    """Set Conference.seatsAvailable, if it changed. Returns the conference."""
+    conf = conf_key.get()
+    if conf and conf.seatsAvailable != seats:
+        conf.seatsAvailable = seats
+        conf.put()
+    return conf
+
+
+@ndb.tasklet
+def seatsAvailableAsync(conf):
+    """
+    Return the total of seats available in the conference, from memcache or
+    else from the shards. Conferences with no shards yet return
+    Conference.seatsAvailable.
+    """
+    ctx = ndb.get_context()
+    key = MEMCACHE_SEATS_KEY % conf.key.urlsafe()
+    seats = yield ctx.memcache_get(key)
+    if seats is None:
+        shards = yield ndb.get_multi_async(shardKeys(conf.key))
+        if all(shard is None for shard in shards):
+            raise ndb.Return(conf.seatsAvailable)
+        seats = sum(shard.seats for shard in shards if shard)
+        yield ctx.memcache_add(key, seats, time=SEATS_CACHE_TIME)
+    raise ndb.Return(seats)
@@ -423,12 +423,36 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
         }
     };
 
+    /**
+     * Token for the next page of the conferences being listed, if any.
+     */
+    $scope.nextPageToken = null;
+
+    /**
+     * Appends the next page of conferences depending on the tab currently selected.
+     */
+    $scope.loadMoreConferences = function () {
+        if ($scope.selectedTab == 'ALL') {
+            $scope.queryConferencesAll(true);
+        } else if ($scope.selectedTab == 'YOU_HAVE_CREATED') {
+            $scope.getConferencesCreated(true);
+        } else if ($scope.selectedTab == 'YOU_WILL_ATTEND') {
+            $scope.getConferencesAttend(true);
+        }
+    };
+
     /**
      * Invokes the conference.queryConferences API.
+     *
+     * @param append if true, the next page is appended to the conferences already listed.
      */
-    $scope.queryConferencesAll = function () {
+    $scope.queryConferencesAll = function (append) {
         var sendFilters = {
-            filters: []
+            filters: [],
+            view: 'SUMMARY'
+        }
+        if (append) {
+            sendFilters.pageToken = $scope.nextPageToken;
         }
         for (var i = 0; i < $scope.filters.length; i++) {
             var filter = $scope.filters[i];
@@ -458,10 +482,13 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                         $scope.alertStatus = 'success';
                         $log.info($scope.messages);
 
-                        $scope.conferences = [];
+                        if (!append) {
+                            $scope.conferences = [];
+                        }
                         angular.forEach(resp.items, function (conference) {
                             $scope.conferences.push(conference);
                         });
+                        $scope.nextPageToken = resp.nextPageToken || null;
                     }
                     $scope.submitted = true;
                 });
@@ -470,10 +497,16 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
 
     /**
      * Invokes the conference.getConferencesCreated method.
+     *
+     * @param append if true, the next page is appended to the conferences already listed.
      */
-    $scope.getConferencesCreated = function () {
+    $scope.getConferencesCreated = function (append) {
         $scope.loading = true;
-        gapi.client.conference.getConferencesCreated().
+        var request = {view: 'SUMMARY'};
+        if (append) {
+            request.pageToken = $scope.nextPageToken;
+        }
+        gapi.client.conference.getConferencesCreated(request).
             execute(function (resp) {
                 $scope.$apply(function () {
                     $scope.loading = false;
@@ -495,10 +528,13 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                         $scope.alertStatus = 'success';
                         $log.info($scope.messages);
 
-                        $scope.conferences = [];
+                        if (!append) {
+                            $scope.conferences = [];
+                        }
                         angular.forEach(resp.items, function (conference) {
                             $scope.conferences.push(conference);
                         });
+                        $scope.nextPageToken = resp.nextPageToken || null;
                     }
                     $scope.submitted = true;
                 });
@@ -506,12 +542,17 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
     };
 
     /**
-     * Retrieves the conferences to attend by calling the conference.getProfile method and
-     * invokes the conference.getConference method n times where n == the number of the conferences to attend.
+     * Invokes the conference.getConferencesToAttend method.
+     *
+     * @param append if true, the next page is appended to the conferences already listed.
      */
-    $scope.getConferencesAttend = function () {
+    $scope.getConferencesAttend = function (append) {
         $scope.loading = true;
-        gapi.client.conference.getConferencesToAttend().
+        var request = {};
+        if (append) {
+            request.pageToken = $scope.nextPageToken;
+        }
+        gapi.client.conference.getConferencesToAttend(request).
             execute(function (resp) {
                 $scope.$apply(function () {
                     if (resp.error) {
@@ -527,7 +568,13 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                         }
                     } else {
                         // The request has succeeded.
-                        $scope.conferences = resp.result.items;
+                        if (!append) {
+                            $scope.conferences = [];
+                        }
+                        angular.forEach(resp.result.items, function (conference) {
+                            $scope.conferences.push(conference);
+                        });
+                        $scope.nextPageToken = resp.result.nextPageToken || null;
                         $scope.loading = false;
                         $scope.messages = 'Query succeeded : Conferences you will attend (or you have attended)';
                         $scope.alertStatus = 'success';
@@ -547,7 +594,7 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
  * @description
  * A controller used for the conference detail page.
  */
-conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $log, $routeParams, HTTP_ERRORS) {
+conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $log, $routeParams, $timeout, HTTP_ERRORS) {
     $scope.conference = {};
 
     $scope.isUserAttending = false;
@@ -624,7 +671,12 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                         return;
                     }
                 } else {
-                    if (resp.result) {
+                    if (resp.result && $scope.conference.queuedAdmission) {
+                        // The registration is queued, poll until it's admitted.
+                        $scope.messages = 'You are in the queue for the conference';
+                        $scope.alertStatus = 'info';
+                        $scope.pollRegistrationStatus();
+                    } else if (resp.result) {
                         // Register succeeded.
                         $scope.messages = 'Registered for the conference';
                         $scope.alertStatus = 'success';
@@ -639,6 +691,31 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
         });
     };
 
+    /**
+     * Polls the conference.getRegistrationStatus method while the registration is queued.
+     */
+    $scope.pollRegistrationStatus = function () {
+        gapi.client.conference.getRegistrationStatus({
+            websafeConferenceKey: $routeParams.websafeConferenceKey
+        }).execute(function (resp) {
+            $scope.$apply(function () {
+                if (resp.error) {
+                    $log.error('Failed to get the registration status : ' + (resp.error.message || ''));
+                } else if (resp.result.status == 'QUEUED') {
+                    $timeout($scope.pollRegistrationStatus, 2000);
+                } else if (resp.result.status == 'REGISTERED') {
+                    $scope.messages = 'Registered for the conference';
+                    $scope.alertStatus = 'success';
+                    $scope.isUserAttending = true;
+                    $scope.conference.seatsAvailable = $scope.conference.seatsAvailable - 1;
+                } else {
+                    $scope.messages = 'Failed to register for the conference : it is sold out';
+                    $scope.alertStatus = 'warning';
+                }
+            });
+        });
+    };
+
     /**
      * Invokes the conference.unregisterForConference method.
      */
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""
+unitofwork.py -- Udacity conference server-side Python App Engine unit of
+    work coalescing the entity writes of a request
+
+Instead of putting each entity as soon as it's changed, code running inside a
+unit of work adds the entities to it, and they are all written with a single
+put_multi when the unit ends (an entity added twice is only written once);
+keys to delete are likewise deleted with a single delete_multi.
+Every remote method of a service decorated with unitOfWorkService runs in a
+unit of work, and so does every function decorated with transactional, whose
+unit is flushed before the transaction commits.
+
+Units are kept in the ndb context, so each transaction has it's own, a
+transaction joining another one shares it's unit, and code running outside
+the transaction (ndb.non_transactional) adds to the unit of the request.
+Outside of any unit (e.g. in task handlers), add just puts the entities.
+
+"""
+
+import functools
+
+from google.appengine.ext import ndb
+
+
+class UnitOfWork(object):
+    """UnitOfWork -- entities to write or delete, and callbacks to run once
+    written"""
+
+    def __init__(self):
+        self.entities = []
+        self.ids = set()
+        self.deleted = []
+        self.callbacks = []
+
+    def add(self, entities):
+        for entity in entities:
+            if id(entity) not in self.ids:
+                self.ids.add(id(entity))
+                self.entities.append(entity)
+
+    def delete(self, keys):
+        for key in keys:
+            if key not in self.deleted:
+                self.deleted.append(key)
+
+    def flush(self):
+        """
+        Write (and delete) the entities added so far, then run the callbacks
+        """
+        entities, self.entities, self.ids = self.entities, [], set()
+        deleted, self.deleted = self.deleted, []
+        callbacks, self.callbacks = self.callbacks, []
+        futures = []
+        if deleted:
+            futures.extend(ndb.delete_multi_async(deleted))
+        if entities:
+            futures.extend(ndb.put_multi_async(entities))
+        ndb.Future.wait_all(futures)
+        for future in futures:
+            future.check_success()
+        for callback in callbacks:
+            callback()
+
+
+def _current():
+    return getattr(ndb.get_context(), '_unitOfWork', None)
+
+
+def active():
+    """Return whether the code runs inside a unit of work"""
+    return _current() is not None
+
+
+def add(*entities):
+    """
+    Add the entities to the current unit of work, to be written when it ends.
+    Outside of any unit, they are written right away. Only entities with a
+    complete key can be added, as their key isn't known until written.
+    """
+    unit = _current()
+    if unit is None:
+        ndb.put_multi(list(entities))
+    else:
+        unit.add(entities)
+
+
+def delete(*keys):
+    """
+    Add the keys to the current unit of work, to be deleted when it ends.
+    Outside of any unit, they are deleted right away.
+    """
+    unit = _current()
+    if unit is None:
+        ndb.delete_multi(list(keys))
+    else:
+        unit.delete(keys)
+
+
+def afterFlush(callback):
+    """
+    Run the callback once the entities of the current unit of work are
+    written (e.g. queueing a task that reads them). Outside of any unit, it's
+    run right away.
+    """
+    unit = _current()
+    if unit is None:
+        callback()
+    else:
+        unit.callbacks.append(callback)
+
+
+def flush():
+    """Write the entities added to the current unit of work so far"""
+    unit = _current()
+    if unit is not None:
+        unit.flush()
+
+
+def unitOfWork(func):
+    """
+    Decorator running the function in a unit of work, flushed when it
+    returns (and discarded if it raises). Joins the current unit, if any.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        ctx = ndb.get_context()
+        if getattr(ctx, '_unitOfWork', None) is not None:
+            return func(*args, **kwargs)
+        unit = ctx._unitOfWork = UnitOfWork()
+        try:
+            result = func(*args, **kwargs)
+            unit.flush()
+            return result
+        finally:
+            ctx._unitOfWork = None
+    return wrapper
+
+
+def transactional(**options):
+    """
+    Same as ndb.transactional, with the function running in a unit of work of
+    the transaction, flushed before it commits.
+    """
+    def decorator(func):
+        return ndb.transactional(**options)(unitOfWork(func))
+    return decorator
+
+
+def unitOfWorkService(cls):
+    """
+    Class decorator running every remote method of a protorpc service in a
+    unit of work. As in perf.profileService, the wrappers keep the attributes
+    of the remote methods.
+    """
+    for name, value in cls.__dict__.items():
+        if hasattr(value, 'remote'):
+            setattr(cls, name, unitOfWork(value))
+    return cls
@@ -1,11 +1,163 @@
+import collections
+import hashlib
 import json
 import os
+import threading
 import time
 import uuid
 
-from google.appengine.api import urlfetch
+from google.appengine.ext import ndb
 from models import Profile
 
+TOKENINFO_URL = 'https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
+# hash of the token
+MEMCACHE_TOKEN_KEY = 'TOKEN_USER_ID:%s'
+# tokens kept in the memory of each instance
+TOKEN_CACHE_SIZE = 1000
+# seconds a token is cached when tokeninfo doesn't tell when it expires
+DEFAULT_TOKEN_TTL = 300
+TOKENINFO_ATTEMPTS = 3
+# seconds between the checks of a lookup of the token by another thread
+LOOKUP_POLL_SECONDS = 0.01
+
+
+class TokenCache(object):
+    """
+    TokenCache -- in memory LRU cache of the user id of the OAuth tokens,
+    expiring with the tokens. Shared by the threads of the instance
+    (threadsafe: yes), hence the lock.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            user_id, expires = entry
+            if expires <= time.time():
+                return None
+            # most recently used go last
+            self.entries[key] = entry
+            return user_id
+
+    def set(self, key, user_id, expires):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (user_id, expires)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+_tokenCache = TokenCache(TOKEN_CACHE_SIZE)
+# token hash -> lookup in progress, so concurrent lookups of the same token
+# wait for it instead of fetching again
+_lookups = {}
+_lookupsLock = threading.Lock()
+
+
+@ndb.tasklet
+def _fetchTokenInfoAsync(token, token_type):
+    """
+    Return the tokeninfo of the token ({} if it couldn't be fetched). Retries
+    wait with ndb.sleep, so other tasklets of the request keep running.
+    """
+    ctx = ndb.get_context()
+    wait = 1
+    for i in range(TOKENINFO_ATTEMPTS):
+        resp = yield ctx.urlfetch(TOKENINFO_URL % (token_type, token))
+        if resp.status_code == 200:
+            raise ndb.Return(json.loads(resp.content))
+        elif resp.status_code == 400 and 'invalid_token' in resp.content:
+            token_type = 'access_token'
+        else:
+            yield ndb.sleep(wait)
+            wait = wait + i
+    raise ndb.Return({})
+
+
+class _Lookup(object):
+    """
+    _Lookup -- lookup of a token in progress. Tasklets of the thread doing
+    it wait for it's future; other threads poll until it's done.
+    """
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.future = None
+        self.done = threading.Event()
+        self.userId = ''
+
+
+@ndb.tasklet
+def _lookupTokenAsync(key, token, token_type):
+    """
+    Return the user id of the token from memcache, or else from tokeninfo,
+    caching it in both tiers until the token expires.
+    """
+    ctx = ndb.get_context()
+    cached = yield ctx.memcache_get(MEMCACHE_TOKEN_KEY % key)
+    if cached is not None:
+        user_id, expires = cached
+        _tokenCache.set(key, user_id, expires)
+        raise ndb.Return(user_id)
+    info = yield _fetchTokenInfoAsync(token, token_type)
+    user_id = info.get('user_id', '')
+    if user_id:
+        ttl = int(info.get('expires_in') or DEFAULT_TOKEN_TTL)
+        if ttl > 0:
+            expires = time.time() + ttl
+            _tokenCache.set(key, user_id, expires)
+            yield ctx.memcache_set(MEMCACHE_TOKEN_KEY % key,
+                    (user_id, expires), time=ttl)
+    raise ndb.Return(user_id)
+
+
+@ndb.tasklet
+def getTokenUserIdAsync(token, token_type='id_token'):
+    """
+    Return the user id of the OAuth token, from the instance cache, memcache
+    or tokeninfo, in that order. Concurrent lookups of a token are coalesced,
+    and none of them blocks the other tasklets of the request.
+    """
+    key = hashlib.sha256(token).hexdigest()
+    user_id = _tokenCache.get(key)
+    if user_id is not None:
+        raise ndb.Return(user_id)
+    with _lookupsLock:
+        lookup = _lookups.get(key)
+        owner = lookup is None
+        if owner:
+            lookup = _lookups[key] = _Lookup()
+    if not owner:
+        if lookup.thread is threading.current_thread():
+            # another tasklet of this thread is looking the token up
+            user_id = yield lookup.future
+        else:
+            # another thread is, use it's result
+            while not lookup.done.is_set():
+                yield ndb.sleep(LOOKUP_POLL_SECONDS)
+            user_id = lookup.userId
+        raise ndb.Return(user_id)
+    try:
+        lookup.future = _lookupTokenAsync(key, token, token_type)
+        lookup.userId = yield lookup.future
+        raise ndb.Return(lookup.userId)
+    finally:
+        with _lookupsLock:
+            del _lookups[key]
+        lookup.done.set()
+
+
+def getTokenUserId(token, token_type='id_token'):
+    """Synchronous version of getTokenUserIdAsync"""
+    return getTokenUserIdAsync(token, token_type).get_result()
+
+
 def getUserId(user, id_type="email"):
     if id_type == "email":
         return user.email()
@@ -17,22 +169,7 @@ def getUserId(user, id_type="email"):
         token_type = 'id_token'
         if 'OAUTH_USER_ID' in os.environ:
             token_type = 'access_token'
-        url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-               % (token_type, token))
-        user = {}
-        wait = 1
-        for i in range(3):
-            resp = urlfetch.fetch(url)
-            if resp.status_code == 200:
-                user = json.loads(resp.content)
-                break
-            elif resp.status_code == 400 and 'invalid_token' in resp.content:
-                url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-                       % ('access_token', token))
-            else:
-                time.sleep(wait)
-                wait = wait + i
-        return user.get('user_id', '')
+        return getTokenUserId(token, token_type)
 
     if id_type == "custom":
         # implement your own user_id creation and getting algorythm